@@ -8,6 +8,7 @@ from py_rete.fact import Fact
 from py_rete.conditions import Bind
 from py_rete.conditions import Filter
 from py_rete.network import ReteNetwork
+import pytest
 
 
 def init_network():
@@ -111,6 +112,76 @@ def test_add_wmes(benchmark):
     benchmark(add_wmes)
 
 
+def build_left_memory(size):
+    net = ReteNetwork()
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Cond(V('y'), 'color', 'red')))
+    def on_red():
+        pass
+
+    net.add_production(on_red)
+
+    for i in range(size):
+        net.add_wme(WME(i, 'on', 'B{}'.format(i)))
+
+    return net
+
+
+@pytest.mark.parametrize('size', [10**3, 10**4, 10**5])
+def test_right_activation_scaling(benchmark, size):
+    # The cost of a right activation should not depend on the number of
+    # tokens in the left (beta) memory because the tokens are hashed on the
+    # join variable.
+    benchmark.group = 'right-activation'
+    net = build_left_memory(size)
+
+    def retract():
+        wme = WME('B0', 'color', 'red')
+        if wme in net.working_memory:
+            net.remove_wme(wme)
+        return (wme,), {}
+
+    benchmark.pedantic(net.add_wme, setup=retract, rounds=200)
+    assert len(list(net.matches)) == 1
+
+
+def build_working_memory(num_facts, width):
+    net = ReteNetwork()
+
+    @Production(Fact(host='h0', load=V('load')) &
+                Filter(lambda load: load < 0))
+    def negative_load(load):
+        pass
+
+    net.add_production(negative_load)
+
+    facts = []
+    for i in range(num_facts):
+        f = Fact(host='h{}'.format(i % 100), load=i,
+                 **{'attr{}'.format(j): i for j in range(width - 2)})
+        net.add_fact(f)
+        facts.append(f)
+
+    return net, facts
+
+
+def test_retract_facts(benchmark):
+    # Retracts 10k facts from a network with 1M WMEs (100k facts with 9
+    # attributes plus their type). Each retraction should only touch the WMEs
+    # of the fact being removed.
+    benchmark.group = 'retraction'
+    net, facts = build_working_memory(10**5, 9)
+    assert len(net.working_memory) == 10**6
+
+    def retract():
+        for f in facts[:10**4]:
+            net.remove_fact(f)
+
+    benchmark.pedantic(retract, rounds=1, iterations=1)
+    assert len(net.working_memory) == 9 * 10**5
+
+
 def test_activation():
     net = ReteNetwork()
     c0 = Cond(V('x'), 'on', V('y'))
@@ -0,0 +1,210 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import heapq
+import random
+
+from py_rete.common import Match
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Dict
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from py_rete.common import Token
+
+
+class Agenda:
+    """
+    The conflict set of a network: the matches (activations) of its
+    productions. The PNodes add and remove matches as they gain and lose
+    tokens, so the agenda is always up to date and selecting the next match to
+    fire does not require collecting all the matches.
+
+    Matches are kept in a heap ordered by the salience of their production
+    (highest first) and then by key (see the subclasses for the conflict
+    resolution strategies). Removed matches are only marked as removed and are
+    dropped when they reach the top of the heap.
+    """
+
+    def __init__(self) -> None:
+        self.heap: List[List[Any]] = []
+        self.entries: Dict[Token, List[Any]] = {}
+        self.counter = 0
+
+    def key(self, match: Match, seq: int) -> Tuple:
+        """
+        Returns the heap key for a match, lower keys are selected first. The
+        seq is the order in which the match was added.
+        """
+        raise NotImplementedError
+
+    def add(self, match: Match) -> None:
+        """
+        Adds a new match to the agenda.
+        """
+        self.counter += 1
+        salience = match.pnode.production.get_salience(match.token)
+        entry = [(-salience,) + self.key(match, self.counter), match]
+        self.entries[match.token] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, token: Token) -> None:
+        """
+        Removes the match for the token from the agenda.
+        """
+        entry = self.entries.pop(token, None)
+        if entry is None:
+            return
+        entry[1] = None
+        if len(self.heap) > 2 * len(self.entries) + 32:
+            self.heap = [e for e in self.heap if e[1] is not None]
+            heapq.heapify(self.heap)
+
+    def select(self) -> Optional[Match]:
+        """
+        Returns the next match according to the strategy (without removing
+        it), or None if the agenda is empty.
+        """
+        heap = self.heap
+        while heap and heap[0][1] is None:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][1]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Match]:
+        for entry in self.entries.values():
+            yield entry[1]
+
+
+def timetags(token: Token) -> List[int]:
+    """
+    Returns the timetags of the wmes in a token, most recent first.
+    """
+    return sorted((wme.timetag for wme in token.wmes if wme is not None),
+                  reverse=True)
+
+
+def recency_key(token: Token) -> Tuple[int, ...]:
+    """
+    A key that orders tokens by the recency of their wmes (lexicographically,
+    most recent wmes first). A token whose timetags extend another's comes
+    first.
+    """
+    return tuple(-t for t in timetags(token)) + (1,)
+
+
+class DepthAgenda(Agenda):
+    """
+    Selects the most recently added match first.
+    """
+
+    def key(self, match: Match, seq: int) -> Tuple:
+        return (-seq,)
+
+
+class BreadthAgenda(Agenda):
+    """
+    Selects the least recently added match first.
+    """
+
+    def key(self, match: Match, seq: int) -> Tuple:
+        return (seq,)
+
+
+class LexAgenda(Agenda):
+    """
+    OPS5's LEX strategy, selects the match with the most recent wmes first.
+    """
+
+    def key(self, match: Match, seq: int) -> Tuple:
+        return (recency_key(match.token), -seq)
+
+
+class MeaAgenda(Agenda):
+    """
+    OPS5's MEA strategy, selects the match whose first condition has the most
+    recent wme first and breaks ties with LEX.
+    """
+
+    def key(self, match: Match, seq: int) -> Tuple:
+        first = match.token.wmes[0]
+        return (-first.timetag if first is not None else 1,
+                recency_key(match.token), -seq)
+
+
+class RandomAgenda(Agenda):
+    """
+    Selects a match uniformly at random from the matches with the highest
+    salience. The matches are kept in a list per salience, so they can be
+    removed (by swapping with the last) and chosen in constant time. The
+    saliences that have matches are kept in a heap (negated, so the highest
+    is first), and the ones that have lost their matches are dropped when
+    they reach the top.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.matches: Dict[float, List[Match]] = {}
+        self.positions: Dict[Token, Tuple[float, int]] = {}
+        self.saliences: List[float] = []
+
+    def add(self, match: Match) -> None:
+        salience = match.pnode.production.get_salience(match.token)
+        if salience not in self.matches:
+            self.matches[salience] = []
+            heapq.heappush(self.saliences, -salience)
+        matches = self.matches[salience]
+        self.positions[match.token] = (salience, len(matches))
+        matches.append(match)
+
+    def remove(self, token: Token) -> None:
+        salience, pos = self.positions.pop(token, (None, None))
+        if salience is None:
+            return
+        matches = self.matches[salience]
+        last = matches.pop()
+        if pos < len(matches):
+            matches[pos] = last
+            self.positions[last.token] = (salience, pos)
+        elif not matches:
+            del self.matches[salience]
+            if len(self.saliences) > 2 * len(self.matches) + 32:
+                self.saliences = [-s for s in self.matches]
+                heapq.heapify(self.saliences)
+
+    def select(self) -> Optional[Match]:
+        heap = self.saliences
+        while heap and -heap[0] not in self.matches:
+            heapq.heappop(heap)
+        if heap:
+            return random.choice(self.matches[-heap[0]])
+        return None
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __iter__(self) -> Iterator[Match]:
+        return iter([m for matches in self.matches.values() for m in matches])
+
+
+STRATEGIES = {'random': RandomAgenda,
+              'depth': DepthAgenda,
+              'breadth': BreadthAgenda,
+              'lex': LexAgenda,
+              'mea': MeaAgenda}
+
+
+def make_agenda(strategy: str) -> Agenda:
+    """
+    Returns an empty agenda for the named conflict resolution strategy.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("Unknown conflict resolution strategy: {}, expected "
+                         "one of {}".format(strategy, ", ".join(STRATEGIES)))
+    return STRATEGIES[strategy]()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from py_rete.common import Token
+from py_rete.common import extend_slots
+from py_rete.ncc_node import NccNode
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Dict
+    from typing import Iterator
+    from typing import Optional
+    from typing import Tuple
+    from py_rete.common import WME
+    from py_rete.conditions import Aggregate
+
+
+class Accumulator:
+    """
+    The running aggregate of the matches (results) in one group. It also
+    keeps the token that was passed on for the group, if any.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.token: Optional[Token] = None
+
+    def add(self, result: Token, value: Any) -> None:
+        self.count += 1
+
+    def remove(self, result: Token, value: Any) -> None:
+        self.count -= 1
+
+    @property
+    def value(self) -> Any:
+        return self.count
+
+
+class SumAccumulator(Accumulator):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.total = 0
+
+    def add(self, result: Token, value: Any) -> None:
+        super().add(result, value)
+        self.total += value
+
+    def remove(self, result: Token, value: Any) -> None:
+        super().remove(result, value)
+        self.total -= value
+
+    @property
+    def value(self) -> Any:
+        return self.total
+
+
+class MinAccumulator(Accumulator):
+    """
+    Keeps the number of matches for each value, so the minimum only has to be
+    recomputed (over the distinct values) when the last match with the
+    minimum value is removed.
+    """
+    reverse = False
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.counts: Dict[Any, int] = {}
+        self.best: Any = None
+
+    def better(self, a: Any, b: Any) -> bool:
+        return a > b if self.reverse else a < b
+
+    def add(self, result: Token, value: Any) -> None:
+        super().add(result, value)
+        self.counts[value] = self.counts.get(value, 0) + 1
+        if self.count == 1 or self.better(value, self.best):
+            self.best = value
+
+    def remove(self, result: Token, value: Any) -> None:
+        super().remove(result, value)
+        self.counts[value] -= 1
+        if not self.counts[value]:
+            del self.counts[value]
+            if value == self.best and self.counts:
+                self.best = (max(self.counts) if self.reverse else
+                             min(self.counts))
+
+    @property
+    def value(self) -> Any:
+        return self.best
+
+
+class MaxAccumulator(MinAccumulator):
+    reverse = True
+
+
+class CollectAccumulator(Accumulator):
+    """
+    Collects the values of the matches (in the order they were added) into a
+    tuple.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.values: Dict[Token, Any] = {}
+
+    def add(self, result: Token, value: Any) -> None:
+        super().add(result, value)
+        self.values[result] = value
+
+    def remove(self, result: Token, value: Any) -> None:
+        super().remove(result, value)
+        del self.values[result]
+
+    @property
+    def value(self) -> Any:
+        return tuple(self.values.values())
+
+
+ACCUMULATORS = {'count': Accumulator,
+                'sum': SumAccumulator,
+                'min': MinAccumulator,
+                'max': MaxAccumulator,
+                'collect': CollectAccumulator}
+
+
+class AggregateNode(NccNode):
+    """
+    A beta network class for aggregate conditions. Like the NccNode, the
+    aggregated conditions are matched by a subnetwork whose results are
+    collected by an NccPartnerNode. Instead of keeping the results, the node
+    keeps a running aggregate (an Accumulator) for each group of each of its
+    tokens (groups), which is updated as results are added and removed.
+
+    For each group, the children are activated with a token that extends the
+    node's token with the group variables and the aggregate. When the
+    aggregate changes, this token (and its descendents) is replaced. The
+    node's own tokens have the parent's slots, the slots of the tokens passed
+    on also have the group variables and the aggregate's variable.
+    """
+
+    def __init__(self, aggregate: Aggregate = None, **kwargs):
+        super().__init__(**kwargs)
+        self.aggregate = aggregate
+        self.groups: Dict[Token, Dict[Tuple, Accumulator]] = {}
+        result_slots = self.partner.slots
+        self.group_slots = [result_slots[v] for v in aggregate.group_by]
+        self.var_slot = (None if aggregate.var is None else
+                         result_slots[aggregate.var])
+        # The group variables that are not bound above, as positions in the
+        # group's key.
+        self.new_group_keys = [i for i, v in enumerate(aggregate.group_by)
+                               if v not in self.parent.slots]
+        self.slots = extend_slots(self.parent.slots,
+                                  list(aggregate.group_by) + [aggregate.to])
+        self.to_slot = self.slots[aggregate.to]
+        self.to_bound = aggregate.to in self.parent.slots
+
+    def remove_token(self, token: Token) -> None:
+        super().remove_token(token)
+        del self.groups[token]
+
+    @property
+    def outputs(self) -> Iterator[Token]:
+        """
+        The tokens that have been passed on to the children.
+        """
+        for groups in self.groups.values():
+            for acc in groups.values():
+                if acc.token is not None:
+                    yield acc.token
+
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
+        new_token = Token(token, wme, self, values, self.parent.slots)
+        self.add_token(new_token)
+        self.groups[new_token] = {}
+        for result in self.partner.new_result_buffer.pop((token, wme), ()):
+            result.owner = new_token
+            self.accumulate(new_token, result)
+        for key in self.groups[new_token]:
+            self.activate_group(new_token, key)
+
+    def accumulate(self, owner: Token, result: Token) -> Tuple:
+        """
+        Adds a result to the aggregate of its group and returns the group's
+        key.
+        """
+        key = self.group_key(result)
+        groups = self.groups[owner]
+        if key not in groups:
+            groups[key] = ACCUMULATORS[self.aggregate.function]()
+        groups[key].add(result, self.result_value(result))
+        return key
+
+    def group_key(self, result: Token) -> Tuple:
+        return tuple(result.values[slot] for slot in self.group_slots)
+
+    def result_value(self, result: Token) -> Any:
+        """
+        The value of the aggregated variable for a result (None if the
+        aggregate is a count).
+        """
+        if self.var_slot is None:
+            return None
+        return result.values[self.var_slot]
+
+    def add_result(self, owner: Token, result: Token) -> None:
+        result.owner = owner
+        key = self.accumulate(owner, result)
+        self.update_group(owner, key)
+
+    def remove_result(self, result: Token) -> None:
+        owner = result.owner
+        if owner not in self.groups:
+            # The owner has already been deleted.
+            return
+        key = self.group_key(result)
+        groups = self.groups[owner]
+        acc = groups[key]
+        acc.remove(result, self.result_value(result))
+        if acc.count:
+            self.update_group(owner, key)
+        else:
+            if acc.token is not None:
+                acc.token.delete_token_and_descendents()
+            del groups[key]
+
+    def update_group(self, owner: Token, key: Tuple) -> None:
+        """
+        Replaces the token passed on for a group if its aggregate changed.
+        """
+        acc = self.groups[owner][key]
+        if acc.token is not None:
+            if acc.token.values[self.to_slot] == acc.value:
+                return
+            acc.token.delete_token_and_descendents()
+            acc.token = None
+        self.activate_group(owner, key)
+
+    def activate_group(self, owner: Token, key: Tuple) -> None:
+        """
+        Activates the children with a token for the group's aggregate. If the
+        aggregate's variable is already bound, then only if it is equal.
+        """
+        acc = self.groups[owner][key]
+        values = owner.values + tuple(key[i] for i in self.new_group_keys)
+        if not self.to_bound:
+            values += (acc.value,)
+        elif values[self.to_slot] != acc.value:
+            return
+        acc.token = Token(owner, None, values=values, slots=self.slots)
+        self.activator.activate(self.children, acc.token, None, values)
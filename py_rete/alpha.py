@@ -1,11 +1,30 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
+from numbers import Number
+import bisect
+
+from py_rete.common import OrderedSet
+from py_rete.common import field_getter
+from py_rete.common import V
+from py_rete.conditions import Predicate
+from py_rete.conditions import IN
+from py_rete.conditions import value_passes
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Generator
+    from typing import Hashable
+    from typing import Iterable
     from typing import List
     from typing import Optional
+    from typing import Tuple
     from py_rete.join_node import JoinNode
     from py_rete.common import WME
+    from py_rete.conditions import FactCond
+
+WILDCARD = '#*#'
 
 
 class AlphaMemory:
@@ -16,10 +35,39 @@ class AlphaMemory:
         Stores a set of WMEs (items). If activating an activated wme does not
         exist, then it addes it. It also right activates all of its successors,
         which correspond to beta nodes.
+
+        The memory can also keep secondary indexes (indexes) that map the value
+        of a WME field (e.g., the identifier) to the WMEs with that value, so
+        join nodes can look up candidates without scanning all the items.
         """
-        self.items: List[WME] = items if items else []
+        self.items: OrderedSet = OrderedSet(items)
         self.successors: List[JoinNode] = successors if successors else []
         self.reference_count = 0
+        self.indexes: Dict[Hashable, Dict[Hashable, OrderedSet]] = {}
+        self.index_getters: Dict[Hashable, Callable[[WME], Any]] = {}
+        # The value index the memory was filled from (see
+        # ReteNetwork.initial_matches), if any.
+        self.value_index: Optional[ValueIndex] = None
+
+    def add_index(self, field: Hashable) -> Dict[Hashable, OrderedSet]:
+        """
+        Adds (or shares) a secondary index on the given WME field and returns
+        it.
+        """
+        if field not in self.indexes:
+            getter = field_getter(field)
+            self.indexes[field] = {}
+            self.index_getters[field] = getter
+            for wme in self.items:
+                self.add_to_index(self.indexes[field], getter(wme), wme)
+        return self.indexes[field]
+
+    @staticmethod
+    def add_to_index(index: Dict[Hashable, OrderedSet], key: Hashable,
+                     wme: WME) -> None:
+        if key not in index:
+            index[key] = OrderedSet()
+        index[key].append(wme)
 
     def activation(self, wme: WME) -> None:
         """
@@ -28,6 +76,320 @@ class AlphaMemory:
         prevent duplicate matches.
         """
         self.items.append(wme)
+        for field, getter in self.index_getters.items():
+            self.add_to_index(self.indexes[field], getter(wme), wme)
         wme.amems.append(self)
         for child in reversed(self.successors):
             child.right_activation(wme)
+
+    def batch_activation(self, wmes: List[WME]) -> None:
+        """
+        Adds a batch of wmes to the alpha memory and then right activates the
+        children with the whole batch. As with single activations, they are
+        activated in reversed order (descendents first), which ensures that
+        each token is joined with each new wme exactly once.
+        """
+        for wme in wmes:
+            self.items.append(wme)
+            for field, getter in self.index_getters.items():
+                self.add_to_index(self.indexes[field], getter(wme), wme)
+            wme.amems.append(self)
+        for child in reversed(self.successors):
+            child.batch_right_activation(wmes)
+
+    def remove(self, wme: WME) -> None:
+        """
+        Removes the wme from the alpha memory and its indexes.
+        """
+        self.items.remove(wme)
+        for field, getter in self.index_getters.items():
+            index = self.indexes[field]
+            key = getter(wme)
+            bucket = index[key]
+            bucket.remove(wme)
+            if not bucket:
+                del index[key]
+
+
+class AttributeNode:
+    """
+    The portion of the alpha discrimination index for a single attribute test
+    (either a constant attribute or the wildcard). The alpha memories are
+    split by which of the identifier and value are tested, so that only the
+    shapes that are actually in use get probed.
+    """
+
+    def __init__(self) -> None:
+        self.any: Optional[AlphaMemory] = None
+        self.by_identifier: Dict[Hashable, AlphaMemory] = {}
+        self.by_value: Dict[Hashable, AlphaMemory] = {}
+        self.by_identifier_value: Dict[Hashable,
+                                       Dict[Hashable, AlphaMemory]] = {}
+        self.predicates: Dict[AlphaMemory, Tuple[Hashable, Hashable,
+                                                 Hashable]] = {}
+        self.size = 0
+
+    def matching_memories(self, wme: WME
+                          ) -> Generator[AlphaMemory, None, None]:
+        if self.by_identifier_value:
+            values = self.by_identifier_value.get(wme.identifier)
+            if values is not None and wme.value in values:
+                yield values[wme.value]
+        if self.by_identifier and wme.identifier in self.by_identifier:
+            yield self.by_identifier[wme.identifier]
+        if self.by_value and wme.value in self.by_value:
+            yield self.by_value[wme.value]
+        if self.any is not None:
+            yield self.any
+        for amem, key in self.predicates.items():
+            if key_passes(key, wme):
+                yield amem
+
+
+def key_passes(key: Tuple[Hashable, Hashable, Hashable], wme: WME) -> bool:
+    """
+    Tests a wme against the constant tests (and predicates) of an alpha
+    memory key.
+    """
+    for test, value in zip(key, (wme.identifier, wme.attribute, wme.value)):
+        if test != WILDCARD and not value_passes(test, value):
+            return False
+    return True
+
+
+class AlphaIndex:
+    """
+    A discrimination index over the constant tests of the alpha memories. WMEs
+    are dispatched first on their attribute and then only to the
+    identifier/value shapes that have live alpha memories, so a WME is routed
+    to exactly the memories it matches without probing keys that do not
+    exist.
+    """
+
+    def __init__(self) -> None:
+        self.attributes: Dict[Hashable, AttributeNode] = {}
+        self.any_attribute: Optional[AttributeNode] = None
+
+    def add(self, key: Tuple[Hashable, Hashable, Hashable],
+            amem: AlphaMemory) -> None:
+        """
+        Registers an alpha memory under its (identifier, attribute, value)
+        key, where untested fields are the wildcard.
+        """
+        identifier, attribute, value = key
+        if attribute == WILDCARD or isinstance(attribute, Predicate):
+            if self.any_attribute is None:
+                self.any_attribute = AttributeNode()
+            node = self.any_attribute
+        else:
+            if attribute not in self.attributes:
+                self.attributes[attribute] = AttributeNode()
+            node = self.attributes[attribute]
+
+        if any(isinstance(test, Predicate) for test in key):
+            node.predicates[amem] = key
+        elif identifier == WILDCARD and value == WILDCARD:
+            node.any = amem
+        elif identifier == WILDCARD:
+            node.by_value[value] = amem
+        elif value == WILDCARD:
+            node.by_identifier[identifier] = amem
+        else:
+            if identifier not in node.by_identifier_value:
+                node.by_identifier_value[identifier] = {}
+            node.by_identifier_value[identifier][value] = amem
+        node.size += 1
+
+    def remove(self, key: Tuple[Hashable, Hashable, Hashable],
+               amem: AlphaMemory) -> None:
+        """
+        Unregisters the alpha memory stored under the given key.
+        """
+        identifier, attribute, value = key
+        if attribute == WILDCARD or isinstance(attribute, Predicate):
+            node = self.any_attribute
+        else:
+            node = self.attributes[attribute]
+
+        if any(isinstance(test, Predicate) for test in key):
+            del node.predicates[amem]
+        elif identifier == WILDCARD and value == WILDCARD:
+            node.any = None
+        elif identifier == WILDCARD:
+            del node.by_value[value]
+        elif value == WILDCARD:
+            del node.by_identifier[identifier]
+        else:
+            del node.by_identifier_value[identifier][value]
+            if not node.by_identifier_value[identifier]:
+                del node.by_identifier_value[identifier]
+        node.size -= 1
+
+        if node.size == 0:
+            if attribute == WILDCARD or isinstance(attribute, Predicate):
+                self.any_attribute = None
+            else:
+                del self.attributes[attribute]
+
+    def matching_memories(self, wme: WME
+                          ) -> Generator[AlphaMemory, None, None]:
+        """
+        Yields every alpha memory whose constant tests the WME passes.
+        """
+        node = self.attributes.get(wme.attribute)
+        if node is not None:
+            yield from node.matching_memories(wme)
+        if self.any_attribute is not None:
+            yield from self.any_attribute.matching_memories(wme)
+
+
+class FactIndex:
+    """
+    Dispatches whole fact WMEs to the alpha memories of whole fact patterns
+    (FactConds). Memories are discriminated on the first constant slot of
+    their pattern, so the full pattern test is only run on the memories whose
+    slot matches the fact (plus the ones with no constant slots).
+    """
+
+    def __init__(self) -> None:
+        self.slots: Dict[Hashable, Dict[Hashable,
+                                        Dict[AlphaMemory, FactCond]]] = {}
+        self.unkeyed: Dict[AlphaMemory, FactCond] = {}
+
+    @staticmethod
+    def get_slot(condition: FactCond) -> Optional[Tuple[Hashable, Hashable]]:
+        for k, p in condition.value:
+            if not isinstance(p, (V, Predicate)):
+                return (k, p)
+        return None
+
+    def add(self, condition: FactCond, amem: AlphaMemory) -> None:
+        """
+        Registers the alpha memory for a whole fact pattern.
+        """
+        slot = self.get_slot(condition)
+        if slot is None:
+            self.unkeyed[amem] = condition
+        else:
+            k, p = slot
+            if k not in self.slots:
+                self.slots[k] = {}
+            if p not in self.slots[k]:
+                self.slots[k][p] = {}
+            self.slots[k][p][amem] = condition
+
+    def remove(self, condition: FactCond, amem: AlphaMemory) -> None:
+        """
+        Unregisters the alpha memory for a whole fact pattern.
+        """
+        slot = self.get_slot(condition)
+        if slot is None:
+            del self.unkeyed[amem]
+        else:
+            k, p = slot
+            del self.slots[k][p][amem]
+            if not self.slots[k][p]:
+                del self.slots[k][p]
+            if not self.slots[k]:
+                del self.slots[k]
+
+    def matching_memories(self, wme: WME
+                          ) -> Generator[AlphaMemory, None, None]:
+        """
+        Yields every alpha memory whose pattern the whole fact WME matches.
+        """
+        if self.slots:
+            for k, v in wme.value.items():
+                values = self.slots.get(k)
+                if values is not None and v in values:
+                    for amem, condition in values[v].items():
+                        if condition.test(wme):
+                            yield amem
+        for amem, condition in self.unkeyed.items():
+            if condition.test(wme):
+                yield amem
+
+
+def value_kind(value: Any) -> Optional[str]:
+    """
+    Returns the kind of a value for sorting, values of the same kind can be
+    compared with each other. Returns None for values that are not sorted.
+    """
+    if isinstance(value, Number) and not isinstance(value, complex):
+        return 'number'
+    if isinstance(value, str):
+        return 'str'
+    return None
+
+
+class ValueIndex:
+    """
+    An index of the wmes for one attribute by their value. It keeps a sorted
+    list of the distinct values of each kind (numbers and strings), so the
+    wmes that pass a range test can be found with a binary search, and the
+    wmes that pass an IN test with a lookup per value.
+
+    The reference_count is the number of alpha memories that were filled
+    from the index, it is dropped once none of them are left.
+    """
+
+    def __init__(self, wmes: Iterable[WME] = ()) -> None:
+        self.buckets: Dict[Hashable, OrderedSet] = {}
+        self.sorted: Dict[str, List[Any]] = {'number': [], 'str': []}
+        self.reference_count = 0
+        for wme in wmes:
+            self.add(wme)
+
+    def add(self, wme: WME) -> None:
+        if wme.value not in self.buckets:
+            self.buckets[wme.value] = OrderedSet()
+            kind = value_kind(wme.value)
+            if kind is not None:
+                bisect.insort(self.sorted[kind], wme.value)
+        self.buckets[wme.value].append(wme)
+
+    def remove(self, wme: WME) -> None:
+        bucket = self.buckets[wme.value]
+        bucket.remove(wme)
+        if not bucket:
+            del self.buckets[wme.value]
+            kind = value_kind(wme.value)
+            if kind is not None:
+                values = self.sorted[kind]
+                del values[bisect.bisect_left(values, wme.value)]
+
+    def matching(self, predicate: Predicate
+                 ) -> Optional[Generator[WME, None, None]]:
+        """
+        Returns an iterator over the wmes whose values pass the predicate, or
+        None if the predicate cannot be answered from the index.
+        """
+        if isinstance(predicate, IN):
+            values = [v for v in predicate.values if v in self.buckets]
+        else:
+            bounds = predicate.bounds
+            if bounds is None:
+                return None
+            low, low_inclusive, high, high_inclusive = bounds
+            kind = value_kind(low if low is not None else high)
+            if kind is None:
+                return None
+            if (low is not None and high is not None and
+                    value_kind(high) != kind):
+                # No value can be compared with both bounds.
+                return (wme for wme in ())
+            values = self.sorted[kind]
+            if low is None:
+                start = 0
+            elif low_inclusive:
+                start = bisect.bisect_left(values, low)
+            else:
+                start = bisect.bisect_right(values, low)
+            if high is None:
+                end = len(values)
+            elif high_inclusive:
+                end = bisect.bisect_right(values, high)
+            else:
+                end = bisect.bisect_left(values, high)
+            values = values[start:end]
+        return (wme for v in values for wme in self.buckets[v])
@@ -1,31 +1,129 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
+from time import perf_counter
 
 from py_rete.common import Token
+from py_rete.common import OrderedSet
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing import Any
+    from typing import Hashable
     from typing import List
     from typing import Dict
     from typing import Optional
+    from typing import Tuple
     from py_rete.common import V
     from py_rete.common import WME
     from py_rete.alpha import AlphaMemory
     from py_rete.join_node import JoinNode
 
 
+class Activations:
+    """
+    Runs the left activations of beta network nodes from an explicit stack,
+    instead of having each node call its children, so the depth of the
+    network does not add Python frames (or hit the recursion limit).
+
+    The activations that a node makes while it is activated are pushed on the
+    stack and run after it returns, in the order they were made and before
+    any other pending activations, so the nodes are activated in the same
+    (depth first) order as when they call each other. Outside of a node's
+    activation (e.g., from a right activation or while tokens are deleted,
+    see Token.delete_tree), there is no stack and activations are run right
+    away. A deferred ReteNetwork keeps its own stack of pending activations,
+    which it runs a few at a time (see ReteNetwork.step).
+
+    Each network has its own Activations (the activator of its nodes), so
+    the activations of different networks are never mixed. An activation
+    whose token has been deleted while it was pending is skipped.
+    """
+
+    def __init__(self) -> None:
+        self.stack: Optional[List[Tuple[ReteNode, Optional[Token],
+                                        Optional[WME],
+                                        Tuple[Any, ...]]]] = None
+
+    def activate(self, nodes: List[ReteNode], token: Optional[Token],
+                 wme: Optional[WME], values: Tuple[Any, ...]) -> None:
+        """
+        Left activates each of the nodes with the token, wme, and values.
+        """
+        stack = self.stack
+        if stack is not None:
+            for node in nodes:
+                stack.append((node, token, wme, values))
+            return
+        self.run([(node, token, wme, values) for node in reversed(nodes)])
+
+    def run(self, stack: List[Tuple[ReteNode, Optional[Token], Optional[WME],
+                                    Tuple[Any, ...]]],
+            budget: Optional[int] = None,
+            deadline: Optional[float] = None) -> int:
+        """
+        Runs the activations on a stack, until it is empty or budget
+        activations have been run or the time (perf_counter) is past the
+        deadline. The activations that are left can be run later by running
+        the same stack again. Returns the number of activations run.
+        """
+        outer = self.stack
+        self.stack = stack
+        count = 0
+        try:
+            while stack:
+                if budget is not None and count >= budget:
+                    break
+                if deadline is not None and perf_counter() >= deadline:
+                    break
+                node, token, wme, values = stack.pop()
+                if token is not None and token.deleted:
+                    continue
+                top = len(stack)
+                node.left_activation(token, wme, values)
+                if len(stack) > top + 1:
+                    stack[top:] = stack[top:][::-1]
+                count += 1
+        finally:
+            self.stack = outer
+        return count
+
+
 class ReteNode:
     """
     Base BetaNode class, tracks parent and children.
+
+    It also has the slots of the values that it passes to its children (see
+    Token), which are the parent's slots unless the node binds variables, and
+    the Activations that runs its left activations (activator), which is
+    shared by all the nodes below a network's root.
     """
     def __init__(self, children: Optional[List[ReteNode]] = None,
                  parent: Optional[ReteNode] = None, **kwargs):
         super().__init__(**kwargs)
         self.children: List[ReteNode] = children if children else []
         self.parent: Optional[ReteNode] = parent
+        self.slots: Dict[V, int] = parent.slots if parent is not None else {}
+        self.activator: Activations = (parent.activator if parent is not None
+                                       else Activations())
 
     def find_nearest_ancestor_with_same_amem(self, amem: AlphaMemory
                                              ) -> Optional[JoinNode]:
+        """
+        Returns the nearest join node on the alpha memory, searching from
+        this node up (see ancestor_to_search), or None. The search is a loop
+        rather than a recursion, so it works for arbitrarily deep networks.
+        """
+        node: Optional[ReteNode] = self
+        while node is not None:
+            if getattr(node, 'amem', None) is amem:
+                return node  # type: ignore
+            node = node.ancestor_to_search()
+        return None
+
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        """
+        The node to search next for the nearest ancestor with the same alpha
+        memory, the search stops at nodes that return None.
+        """
         return None
 
 
@@ -34,27 +132,69 @@ class BetaMemory(ReteNode):
     A memory node for the beta network. Contains items (tokens) and a list of
     `all_children`, which is used in conjunction with `children` to support
     left unlinking.
+
+    It can also keep hash indexes (indexes) of its tokens keyed by the values
+    bound to the variables that its child join nodes test, so right
+    activations only touch the tokens that can join.
     """
     def __init__(self, items: Optional[List[Token]] = None, **kwargs):
         """
         Similar to alpha memory, but items is a set of tokens instead of wmes.
         """
         super().__init__(**kwargs)
-        self.items: List[Token] = items if items else []
+        self.items: OrderedSet = OrderedSet(items)
         self.all_children: List[ReteNode] = []
+        self.indexes: Dict[V, Dict[Hashable, OrderedSet]] = {}
 
-    def find_nearest_ancestor_with_same_amem(self, amem: AlphaMemory
-                                             ) -> Optional[JoinNode]:
-        return self.parent.find_nearest_ancestor_with_same_amem(amem)
+    def add_index(self, v: V) -> Dict[Hashable, OrderedSet]:
+        """
+        Adds (or shares) an index of the tokens on the value bound to the given
+        variable and returns it.
+        """
+        if v not in self.indexes:
+            self.indexes[v] = {}
+            for token in self.items:
+                self.add_to_index(self.indexes[v],
+                                  token.values[token.slots[v]], token)
+        return self.indexes[v]
+
+    @staticmethod
+    def add_to_index(index: Dict[Hashable, OrderedSet], key: Hashable,
+                     token: Token) -> None:
+        if key not in index:
+            index[key] = OrderedSet()
+        index[key].append(token)
+
+    def add_token(self, token: Token) -> None:
+        """
+        Adds a token to the memory and its indexes.
+        """
+        self.items.append(token)
+        for v, index in self.indexes.items():
+            self.add_to_index(index, token.values[token.slots[v]], token)
+
+    def remove_token(self, token: Token) -> None:
+        """
+        Removes a token from the memory and its indexes.
+        """
+        self.items.remove(token)
+        for v, index in self.indexes.items():
+            key = token.values[token.slots[v]]
+            bucket = index[key]
+            bucket.remove(token)
+            if not bucket:
+                del index[key]
+
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        return self.parent
 
     def left_activation(self, token: Optional[Token] = None,
                         wme: Optional[WME] = None,
-                        binding: Optional[Dict[V, Any]] = None):
+                        values: Tuple[Any, ...] = ()):
         """
         Creates a new token based on the incoming token/wme, adds it to the
         memory (items) then activates the children with the token.
         """
-        new_token = Token(token, wme, node=self, binding=binding)
-        self.items.append(new_token)
-        for child in self.children:
-            child.left_activation(new_token)
+        new_token = Token(token, wme, node=self, values=values)
+        self.add_token(new_token)
+        self.activator.activate(self.children, new_token, None, values)
@@ -3,11 +3,14 @@ from typing import TYPE_CHECKING
 import inspect
 
 from py_rete.beta import ReteNode
-from py_rete.common import V
+from py_rete.common import arg_accessors
+from py_rete.common import resolve_args
+from py_rete.common import extend_slots
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Optional
     from typing import Any
-    from typing import Dict
+    from typing import Tuple
     from py_rete.network import ReteNetwork
 
 
@@ -17,6 +20,10 @@ class BindNode(ReteNode):
     it. It gets all the bindings from the incoming token, updates them with the
     current bindings, binds the result to the target variable (to), then
     activates its children with the updated bindings.
+
+    If the target variable is not bound above, then it is given the next slot
+    (the result is appended to the values), otherwise the result is tested
+    against its value.
     """
 
     def __init__(self, children, parent, func, to, rete: ReteNetwork):
@@ -29,32 +36,38 @@ class BindNode(ReteNode):
         self.func = func
         self.bind = to
         self._rete_net = rete
+        self.args = arg_accessors(inspect.getfullargspec(func)[0])
+        self.bound = to in parent.slots
+        self.slots = extend_slots(parent.slots, [to])
+        self.bind_slot = self.slots[to]
+
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        """
+        The search for the nearest join on the same alpha memory continues
+        through the node, so the joins above and below it are right activated
+        in order (descendents first) and do not both match a new wme.
+        """
+        return self.parent
 
-    def get_function_result(self, binding: Dict[V, Any]):
+    def get_function_result(self, values: Tuple[Any, ...]):
         """
-        Given a binding that maps variables to values, this instantiates the
-        arguments for the function and executes it.
+        Given the values of the variables, this instantiates the arguments for
+        the function and executes it.
         """
-        args = inspect.getfullargspec(self.func)[0]
-        args = {arg: self._rete_net if arg == 'net' else
-                self._rete_net.facts[binding[V(arg)]] if
-                binding[V(arg)] in self._rete_net.facts else
-                binding[V(arg)] for arg in args}
-        return self.func(**args)
+        return self.func(**resolve_args(self.args, values, self.parent.slots,
+                                        self._rete_net))
 
-    def left_activation(self, token, wme, binding):
+    def left_activation(self, token, wme, values):
         """
-        Copies and updates the bindings with the results of the function
-        execution. It then left_activates children with this binding.
+        Extends the values with the result of the function execution. It then
+        left_activates children with these values.
         """
-        result = self.get_function_result(binding)
+        result = self.get_function_result(values)
 
-        if self.bind in binding:
-            if binding[self.bind] != result:
+        if self.bound:
+            if values[self.bind_slot] != result:
                 return
         else:
-            binding = binding.copy()
-            binding[self.bind] = result
+            values = values + (result,)
 
-        for child in self.children:
-            child.left_activation(token, wme, binding)
+        self.activator.activate(self.children, token, wme, values)
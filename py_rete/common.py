@@ -1,19 +1,82 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 from dataclasses import dataclass
+from operator import attrgetter
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Callable
+    from typing import Iterable
+    from typing import Iterator
     from typing import Hashable
+    from typing import Dict
     from typing import List
     from typing import Optional
-    from py_rete.alpha import AlphaMemory
+    from typing import Tuple
     from py_rete.beta import ReteNode
     from py_rete.pnode import PNode
+    from py_rete.network import ReteNetwork
 
 
 variable_counter = 0
 
 
+def field_getter(field: Hashable) -> Callable[[WME], Any]:
+    """
+    Returns a function that gets a field from a WME. A field is either the name
+    of a WME attribute (e.g., 'identifier') or, for the slots of a FactWME, a
+    ('value', key) pair.
+    """
+    if isinstance(field, tuple):
+        name, key = field
+        return lambda wme: getattr(wme, name)[key]
+    return attrgetter(field)
+
+
+def arg_accessors(args: Iterable[str]) -> List[Tuple[str, Optional[V]]]:
+    """
+    Resolves the argument names of a function that is called with variable
+    bindings (a Filter, Bind, or Production) into (name, var) pairs, so this
+    only happens once. The var is None for the `net` argument.
+    """
+    return [(arg, None if arg == 'net' else V(arg)) for arg in args]
+
+
+def resolve_args(accessors: List[Tuple[str, Optional[V]]],
+                 values: Tuple[Any, ...], slots: Dict[V, int],
+                 net: ReteNetwork) -> Dict[str, Any]:
+    """
+    Returns the keyword arguments for the accessors, given the values bound to
+    the variables (in their slots). The `net` argument is bound to the
+    network, and values that are fact ids are replaced with the facts.
+    """
+    facts = net.facts
+    kwargs = {}
+    for arg, v in accessors:
+        if v is None:
+            kwargs[arg] = net
+        else:
+            value = values[slots[v]]
+            kwargs[arg] = facts[value] if value in facts else value
+    return kwargs
+
+
+def extend_slots(slots: Dict[V, int], variables: Iterable[V]
+                 ) -> Dict[V, int]:
+    """
+    Returns the slots (the index of each bound variable in the values of a
+    token) after binding the given variables, in order. The slots are shared
+    (not copied) if all of the variables are already bound.
+    """
+    new = [v for v in dict.fromkeys(variables) if v not in slots]
+    if not new:
+        return slots
+    extended = dict(slots)
+    for v in new:
+        extended[v] = len(extended)
+    return extended
+
+
 def gen_variable():
     """
     Used for generating variables with a unique name in the global context.
@@ -23,6 +86,61 @@ def gen_variable():
     return V('genvar{}'.format(variable_counter))
 
 
+class OrderedSet:
+    """
+    An insertion ordered collection of unique (hashable) items that supports
+    constant time append and remove. It is backed by a dict and provides the
+    parts of the list interface that the memories rely on (append, remove,
+    indexing, and reversed iteration), so it can be used in place of a list
+    when items need to be unlinked quickly.
+    """
+    __slots__ = ['_items']
+
+    def __init__(self, items: Optional[Iterable[Any]] = None) -> None:
+        self._items: Dict[Any, None] = dict.fromkeys(items) if items else {}
+
+    def append(self, item: Any) -> None:
+        self._items[item] = None
+
+    def remove(self, item: Any) -> None:
+        del self._items[item]
+
+    def pop(self) -> Any:
+        """
+        Removes and returns the most recently appended item.
+        """
+        return self._items.popitem()[0]
+
+    def __getitem__(self, index: int) -> Any:
+        if index == 0:
+            return next(iter(self._items))
+        if index == -1:
+            return next(reversed(self._items))
+        return list(self._items)[index]
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._items)
+
+    def __reversed__(self) -> Iterator[Any]:
+        return reversed(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (OrderedSet, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "{}({})".format(self.__class__.__name__, list(self._items))
+
+
 @dataclass(eq=True, frozen=True)
 class V:
     """
@@ -41,6 +159,11 @@ class Match:
     token: Token
 
     def fire(self):
+        """
+        Fires the production for the match. The match is refracted first, so
+        it will not be selected from the agenda again.
+        """
+        self.pnode.refract(self.token)
         return self.pnode.production.fire(self.token)
 
 
@@ -50,7 +173,7 @@ class WME:
     essentially comprised of a collection of these elements.
     """
     __slots__ = ['identifier', 'attribute', 'value', 'amems', 'tokens',
-                 'negative_join_results']
+                 'timetag']
 
     def __init__(self, identifier: Hashable, attribute: Hashable, value:
                  Hashable) -> None:
@@ -65,9 +188,10 @@ class WME:
         self.identifier = identifier
         self.attribute = attribute
         self.value = value
-        self.amems: List[AlphaMemory] = []  # the ones containing this WME
-        self.tokens: List[Token] = []  # the ones containing this WME
-        self.negative_join_results: List[NegativeJoinResult] = []
+        self.amems: OrderedSet = OrderedSet()  # the ones containing this WME
+        self.tokens: OrderedSet = OrderedSet()  # the ones containing this WME
+        # the order in which it was added to working memory (for recency)
+        self.timetag = 0
 
     def __hash__(self):
         return hash((self.identifier, self.attribute, self.value))
@@ -86,36 +210,67 @@ class WME:
             self.value == other.value
 
 
+class FactWME(WME):
+    """
+    A WME that stands for a whole fact, it is used when the network matches
+    whole fact patterns. The identifier is the fact id, the attribute is the
+    fact's class, and the value is a dict of the fact's slots.
+    """
+    __slots__: List[str] = []
+
+    def __hash__(self):
+        return hash(self.identifier)
+
+
 class Token:
     """
     Tokens represent matches within the alpha and beta memories. The parent
     corresponds to the match that was extended to create the current token.
+
+    The values bound to the variables are kept in a tuple (values), in the
+    order given by the slots (a dict from each variable to its index). The
+    slots are shared by all the tokens of a node and the values are shared
+    with the parent token when no variables are bound, the binding dict is
+    only built when it is asked for.
+
+    A node that binds new variables copies the parent's values into a longer
+    tuple, so the tokens do not share the bindings of their ancestors: a
+    chain of n binding joins copies O(n^2) values per match (and keeps that
+    many in memory). This keeps the variable lookups a single index, which
+    is what the join tests and filters do most often.
     """
-    __slots__ = ['parent', 'wme', 'node', 'children', 'join_results',
-                 'ncc_results', 'owner', 'binding']
+    __slots__ = ['parent', 'wme', 'node', 'children', 'join_count',
+                 'ncc_results', 'owner', 'values', 'slots', 'deleted']
 
     def __init__(self, parent: Optional[Token],
                  wme: Optional[WME],
                  node: Optional[ReteNode] = None,
-                 binding: Optional[dict] = None
+                 values: Tuple[Any, ...] = (),
+                 slots: Optional[Dict[V, int]] = None
                  ) -> None:
         """
         :type wme: WME
         :type parent: Token
-        :type binding: dict
+        :type values: tuple
+        :type slots: dict (defaults to the slots of the node)
         """
         self.parent = parent
         self.wme = wme
         # points to memory this token is in
         self.node = node
         # the ones with parent = this token
-        self.children: List[Token] = []
-        # used only on tokens in negative nodes
-        self.join_results: List[NegativeJoinResult] = []
-        self.ncc_results: List[Token] = []
+        self.children: OrderedSet = OrderedSet()
+        # the number of matches blocking (negative nodes) or supporting
+        # (exists nodes) the token
+        self.join_count = 0
+        self.ncc_results: OrderedSet = OrderedSet()
         # Ncc
         self.owner: Optional[Token] = None
-        self.binding = binding if binding else {}  # {"$x": "B1"}
+        self.values = values
+        if slots is None:
+            slots = node.slots if node is not None else {}
+        self.slots = slots
+        self.deleted = False
 
         if self.parent:
             self.parent.children.append(self)
@@ -131,6 +286,13 @@ class Token:
     def __hash__(self):
         return hash(id(self))
 
+    @property
+    def binding(self) -> Dict[V, Any]:
+        """
+        The values bound to the variables, e.g., {V('x'): 'B1'}.
+        """
+        return dict(zip(self.slots, self.values))
+
     def is_root(self) -> bool:
         return not self.parent and not self.wme
 
@@ -174,13 +336,53 @@ class Token:
         """
         Helper function to delete all the descendent tokens.
         """
-        while self.children:
-            self.children[0].delete_token_and_descendents()
+        self.delete_tree(False)
 
     def delete_token_and_descendents(self) -> None:
         """
-        Deletes a token and its descendents, but has special cases that make
-        this difficult to understand in isolation.
+        Deletes a token and its descendents.
+        """
+        self.delete_tree(True)
+
+    def delete_tree(self, delete_root: bool) -> None:
+        """
+        Deletes the descendents of the token, children first, and the token
+        itself if delete_root. The tree is walked with an explicit stack
+        rather than recursively, so deep token trees do not hit the recursion
+        limit.
+
+        Deleting a token can activate nodes (e.g., an ncc node's token that
+        loses its last result), these activations are run right away, so they
+        cannot be left pending for tokens that are deleted afterwards.
+        """
+        from py_rete.beta import Activations
+
+        # Tokens without a node (e.g., an aggregate's outputs) use the
+        # activator of their nearest ancestor's node.
+        token = self
+        while token.node is None and token.parent is not None:
+            token = token.parent
+        activator = (token.node.activator if token.node is not None
+                     else Activations())
+        pending = activator.stack
+        activator.stack = None
+        try:
+            stack = [self]
+            while stack:
+                token = stack[-1]
+                if token.children:
+                    stack.append(token.children[0])
+                    continue
+                stack.pop()
+                if delete_root or token is not self:
+                    token.delete_token()
+        finally:
+            activator.stack = pending
+
+    def delete_token(self) -> None:
+        """
+        Deletes a token whose descendents have already been deleted, but has
+        special cases that make this difficult to understand in isolation.
 
         TODO:
             - Add optimization for right unlinking (pg 87 of Doorenbois
@@ -195,15 +397,17 @@ class Token:
         from py_rete.pnode import PNode
         from py_rete.join_node import JoinNode
 
-        while self.children:
-            self.children[0].delete_token_and_descendents()
-
+        self.deleted = True
         if (isinstance(self.node, BetaMemory) and not
                 isinstance(self.node, NccPartnerNode)):
-            self.node.items.remove(self)
+            self.node.remove_token(self)
 
             if isinstance(self.node, PNode):
-                self.node.new = [e for e in self.node.new if e != self]
+                self.node.remove_new(self)
+                if self in self.node.fired:
+                    self.node.fired.remove(self)
+                if self.node.agenda is not None:
+                    self.node.agenda.remove(self)
 
         if self.wme:
             self.wme.tokens.remove(self)
@@ -220,8 +424,6 @@ class Token:
         if isinstance(self.node, NegativeNode):
             if not self.node.items:
                 self.node.amem.successors.remove(self.node)
-            for jr in self.join_results:
-                jr.wme.negative_join_results.remove(jr)
 
         if isinstance(self.node, NccNode):
             for result_tok in self.ncc_results:
@@ -231,19 +433,4 @@ class Token:
                     result_tok.parent.children.remove(result_tok)
 
         elif isinstance(self.node, NccPartnerNode):
-            self.owner.ncc_results.remove(self)
-            if not self.owner.ncc_results and self.node.ncc_node:
-                for bchild in self.node.ncc_node.children:
-                    bchild.left_activation(self.owner, None,
-                                           self.owner.binding)
-
-
-@dataclass(eq=True, frozen=True)
-class NegativeJoinResult:
-    """
-    A new class to store the result of a negative join. Similar to a token, it
-    is owned by a token.
-    """
-    __slots__ = ['owner', 'wme']
-    owner: Token
-    wme: WME
+            self.node.remove_result(self)
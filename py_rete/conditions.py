@@ -4,13 +4,19 @@ from itertools import chain
 from dataclasses import dataclass
 
 from py_rete.common import V
+from py_rete.common import FactWME
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Dict
+    from typing import FrozenSet
     from typing import List
     from typing import Union
     from typing import Tuple
     from typing import Callable
     from typing import Hashable
+    from typing import Iterable
+    from typing import Optional
     from py_rete.common import WME
 
 
@@ -77,6 +83,139 @@ class NOT(ConditionalList, ComposableCond):
     pass
 
 
+class EXISTS(ConditionalList, ComposableCond):
+    """
+    Matches (once) if there is at least one match for the conditions,
+    variables bound inside are not passed on.
+    """
+    pass
+
+
+class Predicate:
+    """
+    A constant test that can be used in place of a constant in a condition
+    (or a Fact pattern), e.g., ``Fact(load=GT(100))``. Like constants, these
+    are tested in the alpha network. Values that cannot be compared with the
+    test (e.g., strings with numbers) do not pass it.
+    """
+
+    def test(self, value: Any) -> bool:
+        raise NotImplementedError
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        """
+        For range tests, returns (low, low inclusive, high, high inclusive),
+        where an unbounded side is None. Returns None for other tests.
+        """
+        return None
+
+
+@dataclass(eq=True, frozen=True)
+class LT(Predicate):
+    bound: Any
+
+    def test(self, value: Any) -> bool:
+        try:
+            return value < self.bound
+        except TypeError:
+            return False
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        return (None, False, self.bound, False)
+
+
+@dataclass(eq=True, frozen=True)
+class LE(Predicate):
+    bound: Any
+
+    def test(self, value: Any) -> bool:
+        try:
+            return value <= self.bound
+        except TypeError:
+            return False
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        return (None, False, self.bound, True)
+
+
+@dataclass(eq=True, frozen=True)
+class GT(Predicate):
+    bound: Any
+
+    def test(self, value: Any) -> bool:
+        try:
+            return value > self.bound
+        except TypeError:
+            return False
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        return (self.bound, False, None, False)
+
+
+@dataclass(eq=True, frozen=True)
+class GE(Predicate):
+    bound: Any
+
+    def test(self, value: Any) -> bool:
+        try:
+            return value >= self.bound
+        except TypeError:
+            return False
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        return (self.bound, True, None, False)
+
+
+@dataclass(eq=True, frozen=True)
+class BETWEEN(Predicate):
+    """
+    Tests that a value is between low and high (inclusive).
+    """
+    low: Any
+    high: Any
+
+    def test(self, value: Any) -> bool:
+        try:
+            return self.low <= value <= self.high
+        except TypeError:
+            return False
+
+    @property
+    def bounds(self) -> Optional[Tuple[Any, bool, Any, bool]]:
+        return (self.low, True, self.high, True)
+
+
+@dataclass(eq=True, frozen=True, init=False)
+class IN(Predicate):
+    """
+    Tests that a value is one of the given values.
+    """
+    values: FrozenSet[Hashable]
+
+    def __init__(self, *values: Hashable):
+        object.__setattr__(self, 'values', frozenset(values))
+
+    def test(self, value: Any) -> bool:
+        return value in self.values
+
+    def __repr__(self):
+        return "IN({})".format(", ".join(repr(v) for v in self.values))
+
+
+def value_passes(pattern: Any, value: Any) -> bool:
+    """
+    Tests a value against the constant or predicate in a pattern.
+    """
+    if isinstance(pattern, Predicate):
+        return pattern.test(value)
+    return pattern == value
+
+
 @dataclass(eq=True, frozen=True)
 class Cond(ConditionalElement, ComposableCond):
     """
@@ -121,7 +260,7 @@ class Cond(ConditionalElement, ComposableCond):
             v = getattr(self, f)
             if isinstance(v, V):
                 continue
-            if v != getattr(w, f):
+            if not value_passes(v, getattr(w, f)):
                 return False
         return True
 
@@ -140,6 +279,96 @@ class Neg(Cond):
         return hash(('neg', self.identifier, self.attribute, self.value))
 
 
+class FactCond(Cond):
+    """
+    A pattern that matches a whole fact (a FactWME) at once, rather than one
+    condition per slot. The identifier is the fact's variable (or id), the
+    attribute is the fact class, and the value is a tuple of (key, pattern)
+    pairs for the slots.
+    """
+    def __repr__(self):
+        slots = ", ".join("{}={}".format(k, p) for k, p in self.value)
+        return "{} << {}({})".format(self.identifier, self.attribute.__name__,
+                                     slots)
+
+    @property
+    def vars(self) -> List[Tuple[Hashable, V]]:
+        """
+        Returns a list of tuples (field, var), slot fields are ('value', key)
+        pairs.
+        """
+        fields = []
+        if isinstance(self.identifier, V):
+            fields.append(('identifier', self.identifier))
+        for k, p in self.value:
+            if isinstance(p, V):
+                fields.append((('value', k), p))
+        return fields
+
+    def contain(self, v: V) -> Hashable:
+        for field, _v in self.vars:
+            if _v == v:
+                return field
+        return ""
+
+    def test(self, w: WME) -> bool:
+        """
+        Checks that the wme is a whole fact, its type, its constant slots,
+        that it has the slots the variables refer to, and that repeated
+        variables have equal values.
+        """
+        if not isinstance(w, FactWME):
+            return False
+        if (not isinstance(self.identifier, V) and
+                self.identifier != w.identifier):
+            return False
+        if not issubclass(w.attribute, self.attribute):
+            return False
+        seen = {}
+        for k, p in self.value:
+            if k not in w.value:
+                return False
+            if isinstance(p, V):
+                if p in seen and seen[p] != w.value[k]:
+                    return False
+                seen[p] = w.value[k]
+            elif not value_passes(p, w.value[k]):
+                return False
+        return True
+
+    @property
+    def alpha_key(self) -> Tuple[Hashable, Hashable, Hashable]:
+        """
+        A key for sharing alpha memories between patterns that only differ in
+        the names of their variables.
+        """
+        canonical: Dict[V, V] = {}
+
+        def canon(p):
+            if not isinstance(p, V):
+                return p
+            if p not in canonical:
+                canonical[p] = V('#{}'.format(len(canonical)))
+            return canonical[p]
+
+        return ('#fact#', canon(self.identifier), self.attribute,
+                tuple((k, canon(p)) for k, p in self.value))
+
+    def __hash__(self):
+        return hash(('factcond', self.identifier, self.attribute, self.value))
+
+
+class FactNeg(FactCond, Neg):
+    """
+    A negated whole fact pattern.
+    """
+    def __repr__(self):
+        return "-{}".format(super().__repr__())
+
+    def __hash__(self):
+        return hash(('factneg', self.identifier, self.attribute, self.value))
+
+
 class Ncc(ConditionalList, ComposableCond):
     """
     A negated conjunction of conditions.
@@ -155,6 +384,92 @@ class Ncc(ConditionalList, ComposableCond):
         return hash(('ncc', tuple(self)))
 
 
+class Exists(ConditionalList, ComposableCond):
+    """
+    An existentially quantified conjunction of conditions.
+    """
+    def __repr__(self):
+        return "+{}".format(super(Exists, self).__repr__())
+
+    @property
+    def number_of_conditions(self) -> int:
+        return len(self)
+
+    def __hash__(self):
+        return hash(('exists', tuple(self)))
+
+
+class Aggregate(ConditionalList, ComposableCond):
+    """
+    Aggregates the matches of a conjunction of conditions. Exactly one of
+    count (True), sum, min, max, or collect (the name of the variable to
+    aggregate) is given, and the result is bound to the variable `to`. The
+    matches are grouped by the group_by variables (one result per group),
+    groups without any matches do not produce a result. Other variables that
+    are only bound inside are not passed on.
+
+    E.g., ``Aggregate(Fact(host=V('h'), load=V('l')), sum='l', group_by='h',
+    to=V('total'))`` binds the total load of each host.
+    """
+    functions = ('count', 'sum', 'min', 'max', 'collect')
+
+    def __new__(cls, *args: Union[ConditionalList, ConditionalElement],
+                to: V, group_by: Union[str, V, Iterable[Union[str, V]]] = (),
+                **kwargs):
+        return super().__new__(cls, *args)
+
+    def __init__(self, *args: Union[ConditionalList, ConditionalElement],
+                 to: V, group_by: Union[str, V, Iterable[Union[str, V]]] = (),
+                 **kwargs):
+        given = [f for f in self.functions if kwargs.get(f)]
+        unknown = [k for k in kwargs if k not in self.functions]
+        if len(given) != 1 or unknown:
+            raise ValueError("Aggregate takes exactly one of: {}".format(
+                ", ".join(self.functions)))
+        self.function: str = given[0]
+        self.var: Optional[V] = (None if self.function == 'count' else
+                                 as_variable(kwargs[self.function]))
+        if isinstance(group_by, (str, V)):
+            group_by = (group_by,)
+        self.group_by: Tuple[V, ...] = tuple(as_variable(v) for v in group_by)
+        self.to = as_variable(to)
+
+    def with_conditions(self, *args: Union[ConditionalList,
+                                           ConditionalElement]
+                        ) -> Aggregate:
+        """
+        Returns the same aggregate over other conditions.
+        """
+        kwargs = {self.function: True if self.var is None else self.var}
+        return Aggregate(*args, to=self.to, group_by=self.group_by, **kwargs)
+
+    @property
+    def number_of_conditions(self) -> int:
+        return len(self)
+
+    def __repr__(self):
+        return "Aggregate({}, {}={}, group_by={}, to={})".format(
+            ", ".join(repr(c) for c in self), self.function, self.var,
+            self.group_by, self.to)
+
+    def __eq__(self, other: object) -> bool:
+        return (isinstance(other, Aggregate) and
+                tuple(self) == tuple(other) and
+                (self.function, self.var, self.group_by, self.to) ==
+                (other.function, other.var, other.group_by, other.to))
+
+    def __hash__(self):
+        return hash(('aggregate', tuple(self), self.function, self.var,
+                     self.group_by, self.to))
+
+
+def as_variable(v: Union[str, V]) -> V:
+    """
+    Returns the variable with the given name (or the variable itself).
+    """
+    return v if isinstance(v, V) else V(v)
+
+
 @dataclass(eq=True, frozen=True)
 class Filter(ConditionalElement, ComposableCond):
     """
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from py_rete.common import Token
+from py_rete.negative_node import NegativeNode
+from py_rete.ncc_node import NccNode
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Tuple
+    from py_rete.common import WME
+
+
+class ExistsNode(NegativeNode):
+    """
+    The positive counterpart of the NegativeNode, for a single existential
+    condition. Each token keeps a count of the wmes that support it
+    (join_count) and is only passed on while the count is above zero, so the
+    children see one token however many wmes match.
+    """
+
+    def passes(self, token: Token) -> bool:
+        return token.join_count > 0
+
+    def right_activation(self, wme: WME):
+        for token in self.matching_tokens(wme):
+            token.join_count += 1
+            if token.join_count == 1:
+                self.activator.activate(self.children, token, None,
+                                        token.values)
+
+    def right_deactivation(self, wme: WME) -> None:
+        """
+        Called when a wme is removed from the alpha memory (before its tokens
+        are deleted, see NegativeNode.right_deactivation), the tokens that
+        are no longer supported by any wme are retracted.
+        """
+        for token in self.matching_tokens(wme):
+            token.join_count -= 1
+            if not token.join_count:
+                token.delete_descendents_of_token()
+
+
+class ConjunctiveExistsNode(NccNode):
+    """
+    The existential counterpart of the NccNode, for a conjunction of
+    conditions. The conditions are matched by a subnetwork whose results are
+    collected by an NccPartnerNode, but the tokens only keep a count of their
+    results (join_count) and are passed on while the count is above zero.
+    """
+
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
+        new_token = Token(token, wme, self, values)
+        self.add_token(new_token)
+        for result in self.partner.new_result_buffer.pop((token, wme), ()):
+            result.owner = new_token
+            new_token.join_count += 1
+        if self.passes(new_token):
+            self.activator.activate(self.children, new_token, None, values)
+
+    def passes(self, token: Token) -> bool:
+        return token.join_count > 0
+
+    def add_result(self, owner: Token, result: Token) -> None:
+        result.owner = owner
+        owner.join_count += 1
+        if owner.join_count == 1:
+            self.activator.activate(self.children, owner, None, owner.values)
+
+    def remove_result(self, result: Token) -> None:
+        owner = result.owner
+        owner.join_count -= 1
+        if not owner.join_count:
+            owner.delete_descendents_of_token()
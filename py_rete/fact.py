@@ -4,8 +4,10 @@ from itertools import chain
 
 from py_rete.conditions import ComposableCond
 from py_rete.conditions import Cond
+from py_rete.conditions import FactCond
 from py_rete.common import gen_variable
 from py_rete.common import WME
+from py_rete.common import FactWME
 from py_rete.common import V
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -61,6 +63,38 @@ class Fact(ComposableCond, dict):
         for class_name in self.__class__.mro()[:-3]:
             yield Cond(fact_id, '__fact_type__', class_name)
 
+    @property
+    def fact_cond(self) -> FactCond:
+        """
+        A single condition that matches the whole fact, used when the network
+        matches whole fact patterns.
+        """
+        if self.id is None:
+            fact_id = self.gen_var
+        else:
+            fact_id = self.id
+
+        if any(isinstance(k, V) for k in self):
+            raise ValueError("Whole fact patterns cannot have variable keys.")
+
+        return FactCond(fact_id, self.__class__, tuple(self.items()))
+
+    @property
+    def fact_wme(self) -> FactWME:
+        """
+        A single WME for the whole fact, used when the network matches whole
+        fact patterns.
+        """
+        if self.id is None:
+            raise ValueError("No id assigned to fact, add to network first.")
+
+        for k in self:
+            if isinstance(k, V) or isinstance(self[k], V):
+                raise ValueError("Facts converted into wmes cannot have"
+                                 " variables.")
+
+        return FactWME(self.id, self.__class__, dict(self))
+
     @property
     def wmes(self) -> Generator[WME, None, None]:
         if self.id is None:
@@ -3,9 +3,11 @@ from typing import TYPE_CHECKING
 import inspect
 
 from py_rete.beta import ReteNode
-from py_rete.common import V
+from py_rete.common import arg_accessors
+from py_rete.common import resolve_args
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Optional
     from typing import List
     from typing import Callable
     from py_rete.network import ReteNetwork
@@ -25,23 +27,26 @@ class FilterNode(ReteNode):
         super().__init__(children=children, parent=parent)
         self.func = func
         self._rete_net = rete
+        self.args = arg_accessors(inspect.getfullargspec(func)[0])
 
-    def get_function_result(self, token, wme, binding):
-        args = inspect.getfullargspec(self.func)[0]
-        args = {arg: self._rete_net if arg == 'net' else
-                self._rete_net.facts[binding[V(arg)]] if
-                binding[V(arg)] in self._rete_net.facts else
-                binding[V(arg)] for arg in args}
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        """
+        The search for the nearest join on the same alpha memory continues
+        through the node, so the joins above and below it are right activated
+        in order (descendents first) and do not both match a new wme.
+        """
+        return self.parent
 
-        return self.func(**args)
+    def get_function_result(self, token, wme, values):
+        return self.func(**resolve_args(self.args, values, self.slots,
+                                        self._rete_net))
 
-    def left_activation(self, token, wme, binding):
+    def left_activation(self, token, wme, values):
         """
-        :type binding: dict
+        :type values: tuple
         :type wme: WME
         :type token: Token
         """
-        result = self.get_function_result(token, wme, binding)
+        result = self.get_function_result(token, wme, values)
         if bool(result):
-            for child in self.children:
-                child.left_activation(token, wme, binding)
+            self.activator.activate(self.children, token, wme, values)
@@ -4,15 +4,68 @@ from typing import TYPE_CHECKING
 from py_rete.common import Token
 from py_rete.common import WME
 from py_rete.common import V
+from py_rete.common import field_getter
+from py_rete.common import extend_slots
 from py_rete.alpha import AlphaMemory
 from py_rete.beta import ReteNode
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing import Dict
     from typing import Any
+    from typing import Callable
+    from typing import Hashable
+    from typing import List
+    from typing import Container
+    from typing import Optional
+    from typing import Tuple
     from py_rete.conditions import Cond
 
 
+def field_source(field: Hashable, namespace: Dict[str, Any]) -> str:
+    """
+    Returns the python source for reading a field from a WME named `wme`.
+    Slot keys are added to the namespace, so they do not need a literal
+    representation.
+    """
+    if isinstance(field, tuple):
+        name, key = field
+        namespace['k{}'.format(len(namespace))] = key
+        return "wme.{}[k{}]".format(name, len(namespace) - 1)
+    if field not in ('identifier', 'attribute', 'value'):
+        raise ValueError("Unknown WME field: {}".format(field))
+    return "wme.{}".format(field)
+
+
+def compile_join(tests: List[Tuple[int, Hashable]], binds: List[Hashable]
+                 ) -> Tuple[Callable[[Token, WME], bool],
+                            Callable[[Token, WME], Tuple[Any, ...]]]:
+    """
+    Generates a join test and a binding function specialized for the given
+    tests ((slot, field) pairs, the field must equal the token's value in the
+    slot) and binds (the fields whose values are appended to the token's
+    values), with the field accesses and comparisons unrolled. They are
+    equivalent to JoinNode.perform_join_test and JoinNode.make_binding.
+    """
+    namespace: Dict[str, Any] = {}
+    test = ["def perform_join_test(token, wme):",
+            "    values = token.values"]
+    for slot, field in tests:
+        test.append("    if {} != values[{}]:".format(
+            field_source(field, namespace), slot))
+        test.append("        return False")
+    test.append("    return True")
+    make = ["def make_binding(token, wme):"]
+    if binds:
+        make.append("    return token.values + ({},)".format(
+            ", ".join(field_source(field, namespace) for field in binds)))
+    else:
+        make.append("    return token.values")
+
+    code = compile("\n".join(test + make), '<join>', 'exec')
+    exec(code, namespace)
+    return namespace['perform_join_test'], namespace['make_binding']
+
+
 class JoinNode(ReteNode):
     """
     A beta network class. Does the heavly lifting of joining tokens from a beta
@@ -32,22 +85,82 @@ class JoinNode(ReteNode):
     the wmes from the alpha memory instead (essentially the opposite direction
     as above). Similarly, for matches, updated bindings are created and
     children are activated.
+
+    If any of the condition's variables are bound by the conditions above
+    (bound_vars), then one of them is used as the index. Left activations
+    only look at the alpha memory WMEs with the matching value for that field
+    and right activations only look at the parent tokens with the matching
+    value for that variable.
+
+    The variables that are bound above are tested against the token's values
+    (tests) and the others are bound, i.e., appended to the token's values
+    (binds), so the node's slots extend its parent's slots with them.
+
+    If compiled is True, then perform_join_test and make_binding are replaced
+    by functions generated for the condition's variables (see compile_join),
+    otherwise the generic (interpreted) methods are used.
     """
-    def __init__(self, amem: AlphaMemory, condition: Cond, **kwargs):
+    compiled = True
+
+    def __init__(self, amem: AlphaMemory, condition: Cond,
+                 bound_vars: Container[V] = (), **kwargs):
         super().__init__(**kwargs)
         self.amem: AlphaMemory = amem
         self.condition = condition
         self.nearest_ancestor_with_same_amem = None
         self.vars = [(v, field) for field, v in self.condition.vars if
                      isinstance(v, V)]
+        parent_slots = self.parent.slots
+        self.tests: List[Tuple[int, Hashable]] = [
+            (parent_slots[v], field) for v, field in self.vars
+            if v in parent_slots]
+        # If a new variable appears more than once, the last field is bound.
+        new_vars = {v: field for v, field in self.vars
+                    if v not in parent_slots}
+        self.binds: List[Hashable] = list(new_vars.values())
+        self.slots = extend_slots(parent_slots, new_vars)
+        self.test_getters: List[Tuple[int, Callable[[WME], Any]]] = [
+            (slot, field_getter(field)) for slot, field in self.tests]
+        self.bind_getters: List[Callable[[WME], Any]] = [
+            field_getter(field) for field in self.binds]
+        if self.compiled:
+            self.perform_join_test, self.make_binding = (  # type: ignore
+                compile_join(self.tests, self.binds))
+        self.index: Optional[Tuple[V, Hashable]] = self.choose_index(
+            bound_vars)
+        self.index_getter: Optional[Callable[[WME], Any]] = None
+        self.index_slot: Optional[int] = None
+
+        if self.index:
+            self.index_getter = field_getter(self.index[1])
+            self.index_slot = parent_slots[self.index[0]]
+            self.amem.add_index(self.index[1])
+            self.parent.add_index(self.index[0])
+
+    def choose_index(self, bound_vars: Container[V]
+                     ) -> Optional[Tuple[V, Hashable]]:
+        """
+        Returns the (var, field) pair to index the join on, preferring the
+        identifier, or None if none of the condition's variables are bound
+        above.
+        """
+        candidates = [(v, field) for v, field in self.vars
+                      if v in bound_vars]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda vf: vf[1] != 'identifier')
 
     @property
     def amem_recently_nonempty(self) -> bool:
         return len(self.amem.items) == 1
 
-    @property
-    def parent_recently_nonempty(self) -> bool:
-        return len(self.parent.items) == 1
+    def parent_recently_nonempty(self, token: Token) -> bool:
+        """
+        Whether the parent memory became nonempty with the token, i.e., the
+        token is its first item. Activations are run after the node that made
+        them returns, so the memory may already have more tokens.
+        """
+        return self.parent.items[0] is token
 
     @property
     def right_unlinked(self) -> bool:
@@ -61,10 +174,8 @@ class JoinNode(ReteNode):
         ancestor = self.parent.find_nearest_ancestor_with_same_amem(self.amem)
         self.nearest_ancestor_with_same_amem = ancestor
 
-    def find_nearest_ancestor_with_same_amem(self, amem: AlphaMemory):
-        if self.amem == amem:
-            return self
-        return self.parent.find_nearest_ancestor_with_same_amem(amem)
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        return self.parent
 
     def right_activation(self, wme: WME, new_node=False) -> None:
         """
@@ -77,11 +188,44 @@ class JoinNode(ReteNode):
             self.relink_to_beta_memory()
             if not self.parent.items:
                 self.amem.successors.remove(self)
-        for token in self.parent.items:
+        if self.index:
+            tokens = self.parent.indexes[self.index[0]].get(
+                self.index_getter(wme), ())
+        else:
+            tokens = self.parent.items
+        for token in tokens:
             if self.perform_join_test(token, wme):
-                binding = self.make_binding(token, wme)
-                for child in self.children:
-                    child.left_activation(token, wme, binding)
+                self.activate_children(token, wme,
+                                       self.make_binding(token, wme))
+
+    def batch_right_activation(self, wmes: List[WME]) -> None:
+        """
+        Called when a batch of elements is added to the respective alpha
+        memory. If the join is indexed, then the wmes are grouped by their
+        value for the index, so the parent tokens for each value are looked up
+        once (a hash join).
+        """
+        if len(self.amem.items) == len(wmes):
+            self.relink_to_beta_memory()
+            if not self.parent.items:
+                self.amem.successors.remove(self)
+        if self.index:
+            groups: Dict[Hashable, List[WME]] = {}
+            for wme in wmes:
+                key = self.index_getter(wme)
+                if key not in groups:
+                    groups[key] = []
+                groups[key].append(wme)
+            index = self.parent.indexes[self.index[0]]
+            pairs = ((token, wme) for key, group in groups.items()
+                     for token in index.get(key, ()) for wme in group)
+        else:
+            pairs = ((token, wme) for token in self.parent.items
+                     for wme in wmes)
+        for token, wme in pairs:
+            if self.perform_join_test(token, wme):
+                self.activate_children(token, wme,
+                                       self.make_binding(token, wme))
 
     def relink_to_alpha_memory(self):
         ancestor = self.nearest_ancestor_with_same_amem
@@ -99,39 +243,49 @@ class JoinNode(ReteNode):
     def relink_to_beta_memory(self):
         self.parent.children.append(self)
 
-    def left_activation(self, token: Token) -> None:
+    def left_activation(self, token: Token, wme: Optional[WME] = None,
+                        values: Tuple[Any, ...] = ()) -> None:
         """
-        Called when an element is added to the parent beta node.
+        Called when an element is added to the parent beta node. The wme and
+        values are ignored (they are those of the token).
         """
-        if self.parent_recently_nonempty:
+        if self.parent_recently_nonempty(token):
             self.relink_to_alpha_memory()
             if not self.amem.items:
                 self.parent.children.remove(self)
-        for wme in self.amem.items:
+        if self.index:
+            wmes = self.amem.indexes[self.index[1]].get(
+                token.values[self.index_slot], ())
+        else:
+            wmes = self.amem.items
+        for wme in wmes:
             if self.perform_join_test(token, wme):
-                binding = self.make_binding(token, wme)
-                for child in self.children:
-                    child.left_activation(token=token, wme=wme,
-                                          binding=binding)
+                self.activate_children(token, wme,
+                                       self.make_binding(token, wme))
+
+    def activate_children(self, token: Token, wme: WME,
+                          values: Tuple[Any, ...]) -> None:
+        """
+        Left activates the children with a successful join of token and wme.
+        """
+        self.activator.activate(self.children, token, wme, values)
 
     def perform_join_test(self, token: Token, wme: WME) -> bool:
         """
         Test if the token and wme are compatible.
         """
-        for v, field in self.vars:
-            if (v in token.binding and
-                    getattr(wme, field) != token.binding[v]):
+        values = token.values
+        for slot, getter in self.test_getters:
+            if getter(wme) != values[slot]:
                 return False
         return True
 
-    def make_binding(self, token: Token, wme: WME) -> Dict[V, Any]:
+    def make_binding(self, token: Token, wme: WME) -> Tuple[Any, ...]:
         """
-        Makes updated bindings that result from joining token and wme.
+        Makes the values that result from joining token and wme. The values
+        of the token are copied when variables are bound (see Token).
         """
-        new_binding = {v: getattr(wme, field) for v, field in self.vars}
-        if new_binding:
-            binding = token.binding.copy()
-            binding.update(new_binding)
-            return binding
-        else:
-            return token.binding
+        if self.bind_getters:
+            return token.values + tuple(getter(wme)
+                                        for getter in self.bind_getters)
+        return token.values
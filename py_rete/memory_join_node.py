@@ -0,0 +1,62 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from py_rete.common import Token
+from py_rete.beta import BetaMemory
+from py_rete.join_node import JoinNode
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Optional
+    from typing import Tuple
+    from py_rete.common import WME
+
+
+class MemoryJoinNode(BetaMemory, JoinNode):  # type: ignore
+    """
+    A join node merged with the beta memory below it (the Rete/UL memory
+    node). Instead of passing each successful join to a separate BetaMemory,
+    it stores the resulting token in its own items and left activates its
+    children with that token, so it also serves as the parent memory for the
+    next join.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    def left_activation(self, token: Token, wme: Optional[WME] = None,
+                        values: Tuple[Any, ...] = ()) -> None:
+        """
+        Called when a token is added to the parent memory. The wme and values
+        are ignored, they are accepted so that memory join nodes can be left
+        activated in the same way as the other children of a memory join node.
+        """
+        JoinNode.left_activation(self, token)
+
+    def activate_children(self, token: Token, wme: WME,
+                          values: Tuple[Any, ...]) -> None:
+        """
+        Stores a new token for the join of token and wme, then left activates
+        the children with it.
+        """
+        new_token = Token(token, wme, node=self, values=values)
+        self.add_token(new_token)
+        self.activator.activate(self.children, new_token, None, values)
+
+    def update_from_above(self) -> None:
+        """
+        Fills the memory of a newly built node with the joins of the tokens
+        already in the parent memory and the wmes already in the alpha
+        memory.
+        """
+        for token in self.parent.items:
+            if self.index:
+                wmes = self.amem.indexes[self.index[1]].get(
+                    token.values[self.index_slot], ())
+            else:
+                wmes = self.amem.items
+            for wme in wmes:
+                if self.perform_join_test(token, wme):
+                    self.add_token(Token(token, wme, node=self,
+                                         values=self.make_binding(token,
+                                                                  wme)))
@@ -2,18 +2,21 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from py_rete.common import Token
-from py_rete.alpha import AlphaMemory
 from py_rete.beta import BetaMemory
+from py_rete.beta import Activations
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing import Optional
     from typing import List
     from typing import Dict
     from typing import Any
+    from typing import Tuple
     from py_rete.beta import ReteNode
     from py_rete.common import V
     from py_rete.common import WME
 
+    OwnerKey = Tuple[Optional[Token], Optional[WME]]
+
 
 class NccNode(BetaMemory):
     """
@@ -24,25 +27,61 @@ class NccNode(BetaMemory):
     the newly created token's ncc_results list, and sets the owner of the
     result to the new token. If the new token does not have a any results in
     the ncc_results list, then it activates all the children.
+
+    The tokens are also indexed by their (parent token, wme) key (owners), so
+    the partner can find the owner of a new result without a scan.
     """
 
     def __init__(self, partner: NccPartnerNode = None, **kwargs):
         super().__init__(**kwargs)
         self.partner = partner
+        self.owners: Dict[OwnerKey, Token] = {}
+
+    def ancestor_to_search(self) -> Optional[ReteNode]:
+        return self.partner.parent
 
-    def find_nearest_ancestor_with_same_amem(self, amem: AlphaMemory):
-        return self.partner.parent.find_nearest_ancestor_with_same_amem(amem)
+    def add_token(self, token: Token) -> None:
+        super().add_token(token)
+        self.owners[(token.parent, token.wme)] = token
 
-    def left_activation(self, token: Token, wme: WME, binding: Dict[V, Any]):
-        new_token = Token(token, wme, self, binding)
-        self.items.append(new_token)
-        for result in self.partner.new_result_buffer:
-            self.partner.new_result_buffer.remove(result)
+    def remove_token(self, token: Token) -> None:
+        super().remove_token(token)
+        del self.owners[(token.parent, token.wme)]
+
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
+        new_token = Token(token, wme, self, values)
+        self.add_token(new_token)
+        for result in self.partner.new_result_buffer.pop((token, wme), ()):
             new_token.ncc_results.append(result)
             result.owner = new_token
-        if not new_token.ncc_results:
-            for child in self.children:
-                child.left_activation(new_token, None, binding)
+        if self.passes(new_token):
+            self.activator.activate(self.children, new_token, None, values)
+
+    def passes(self, token: Token) -> bool:
+        """
+        Returns whether a token in the node is passed on to the children.
+        """
+        return not token.ncc_results
+
+    def add_result(self, owner: Token, result: Token) -> None:
+        """
+        Adds a new result from the partner to a token that is already in the
+        node, which blocks the token.
+        """
+        owner.ncc_results.append(result)
+        result.owner = owner
+        owner.delete_descendents_of_token()
+
+    def remove_result(self, result: Token) -> None:
+        """
+        Removes a deleted result from its owner, the owner is passed on once
+        it has no results left.
+        """
+        owner = result.owner
+        owner.ncc_results.remove(result)
+        if not owner.ncc_results:
+            self.activator.activate(self.children, owner, None, owner.values)
 
 
 class NccPartnerNode:
@@ -50,30 +89,62 @@ class NccPartnerNode:
     The partner node for negated conjunctive conditions node.
 
     Takes the associated ncc node, the number of conditions, and a buffer of
-    any new results.
+    any new results whose owner is not in the ncc node yet, keyed by the
+    owner's (parent token, wme) key. If match_wme is False (the ncc node's
+    parent does not pass on wmes, e.g., a memory join node), then the ncc
+    node's tokens are identified by their parent alone.
     """
 
     def __init__(self, parent: Optional[ReteNode] = None,
                  ncc_node: Optional[NccNode] = None,
                  number_of_conditions: int = 0,
-                 new_result_buffer: Optional[List[Token]] = None):
+                 new_result_buffer: Optional[Dict[OwnerKey,
+                                                  List[Token]]] = None,
+                 match_wme: bool = True):
         self.parent = parent
+        self.slots: Dict[V, int] = parent.slots if parent is not None else {}
+        self.activator: Activations = (parent.activator if parent is not None
+                                       else Activations())
         self.ncc_node = ncc_node
         self.number_of_conditions = number_of_conditions
-        self.new_result_buffer = new_result_buffer if new_result_buffer else []
+        self.new_result_buffer = (new_result_buffer if new_result_buffer
+                                  else {})
+        self.match_wme = match_wme
 
-    def left_activation(self, token: Token, wme: WME, binding: Dict[V, Any]):
-        new_result = Token(token, wme, self, binding)
-        owners_t = token
-        owners_w = wme
+    def owner_key(self, result: Token) -> OwnerKey:
+        """
+        Returns the key of the ncc node token that owns a result, found by
+        walking back up the subnetwork.
+        """
+        owners_t = result.parent
+        owners_w = result.wme
         for i in range(self.number_of_conditions):
             owners_w = owners_t.wme
             owners_t = owners_t.parent
-        for token in self.ncc_node.items:
-            if token.parent == owners_t and token.wme == owners_w:
-                token.ncc_results.append(new_result)
-                new_result.owner = token
-                token.delete_descendents_of_token()
-                break
+        return (owners_t, owners_w if self.match_wme else None)
+
+    def remove_result(self, result: Token) -> None:
+        """
+        Called when a result is deleted, results that have no owner yet are
+        removed from the buffer.
+        """
+        if result.owner is None:
+            key = self.owner_key(result)
+            results = self.new_result_buffer[key]
+            results.remove(result)
+            if not results:
+                del self.new_result_buffer[key]
+        elif self.ncc_node:
+            self.ncc_node.remove_result(result)
+
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
+        new_result = Token(token, wme, self, values)
+        key = self.owner_key(new_result)
+        owner = self.ncc_node.owners.get(key)
+        if owner is not None:
+            self.ncc_node.add_result(owner, new_result)
         else:
-            self.new_result_buffer.append(new_result)
+            if key not in self.new_result_buffer:
+                self.new_result_buffer[key] = []
+            self.new_result_buffer[key].append(new_result)
@@ -2,14 +2,15 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from py_rete.common import Token
-from py_rete.common import NegativeJoinResult
-from py_rete.alpha import AlphaMemory
+from py_rete.common import field_getter
 from py_rete.beta import BetaMemory
 from py_rete.join_node import JoinNode
 
 if TYPE_CHECKING:  # pragma: no cover
-    from typing import Dict
     from typing import Any
+    from typing import Container
+    from typing import List
+    from typing import Tuple
     from py_rete.common import V
     from py_rete.common import WME
 
@@ -20,44 +21,86 @@ class NegativeNode(BetaMemory, JoinNode):  # type: ignore
     left activation is called by the parent beta node.  The right activation is
     called from the alpha network (amem).  Test are similar to those that
     appear in JoinNode
+
+    Each token only keeps a count of the wmes that block it (join_count), as
+    the blocking wmes themselves are never needed. If one of the condition's
+    variables is bound above, then the node indexes its own tokens on it (and
+    the alpha memory on the matching field), so activations only test the
+    tokens and wmes that can match.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, bound_vars: Container[V] = (), **kwargs):
         super().__init__(**kwargs)
-
-    def find_nearest_ancestor_with_same_amem(self, amem: AlphaMemory):
-        if self.amem == amem:
-            return self
-        return self.parent.find_nearest_ancestor_with_same_amem(amem)
+        # The condition's variables are only tested, not bound.
+        self.slots = self.parent.slots
+        self.index = self.choose_index(bound_vars)
+        if self.index:
+            self.index_getter = field_getter(self.index[1])
+            self.index_slot = self.slots[self.index[0]]
+            self.amem.add_index(self.index[1])
+            self.add_index(self.index[0])
 
     @property
     def right_unlinked(self) -> bool:
         return len(self.items) == 0
 
-    def left_activation(self, token: Token, wme: WME, binding: Dict[V, Any]):
+    def matching_tokens(self, wme: WME) -> List[Token]:
+        """
+        Returns the tokens in the node that the wme matches (i.e., blocks).
+        """
+        if self.index:
+            tokens = self.indexes[self.index[0]].get(self.index_getter(wme),
+                                                     ())
+        else:
+            tokens = self.items
+        return [token for token in tokens
+                if self.perform_join_test(token, wme)]
+
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
         if not self.items:
             self.relink_to_alpha_memory()
 
-        new_token = Token(parent=token, wme=wme, node=self, binding=binding)
-        self.items.append(new_token)
+        new_token = Token(parent=token, wme=wme, node=self, values=values)
+        self.add_token(new_token)
 
-        for wme in self.amem.items:
+        if self.index:
+            wmes = self.amem.indexes[self.index[1]].get(
+                values[self.index_slot], ())
+        else:
+            wmes = self.amem.items
+        for wme in wmes:
             if self.perform_join_test(new_token, wme):
-                jr = NegativeJoinResult(new_token, wme)
-                new_token.join_results.append(jr)
-                wme.negative_join_results.append(jr)
+                new_token.join_count += 1
 
-        if not new_token.join_results:
-            for child in self.children:
-                child.left_activation(new_token, None, binding)
+        if self.passes(new_token):
+            self.activator.activate(self.children, new_token, None, values)
+
+    def passes(self, token: Token) -> bool:
+        """
+        Returns whether a token in the node is passed on to the children.
+        """
+        return not token.join_count
+
+    def batch_right_activation(self, wmes: List[WME]) -> None:
+        for wme in wmes:
+            self.right_activation(wme)
 
     def right_activation(self, wme: WME):
-        for token in self.items:
-            if self.perform_join_test(token, wme):
-                if not token.join_results:
-                    # TODO: TEST THIS - Chris
-                    token.delete_descendents_of_token()
-                    # t.delete_token_and_descendents()
-                jr = NegativeJoinResult(token, wme)
-                token.join_results.append(jr)
-                wme.negative_join_results.append(jr)
+        for token in self.matching_tokens(wme):
+            if not token.join_count:
+                token.delete_descendents_of_token()
+            token.join_count += 1
+
+    def right_deactivation(self, wme: WME) -> None:
+        """
+        Called when a wme is removed from the alpha memory, the tokens it
+        blocked that are no longer blocked by any wme are passed on. It is
+        called before the wme's tokens are deleted (see
+        ReteNetwork.remove_wme), so the tokens it matches all counted it.
+        """
+        for token in self.matching_tokens(wme):
+            token.join_count -= 1
+            if not token.join_count:
+                self.activator.activate(self.children, token, None,
+                                        token.values)
@@ -1,69 +1,157 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
-import random
-from itertools import product
-
+from collections import deque
+from time import perf_counter
 from py_rete.bind_node import BindNode
 from py_rete.filter_node import FilterNode
 from py_rete.ncc_node import NccPartnerNode
 from py_rete.ncc_node import NccNode
 from py_rete.negative_node import NegativeNode
+from py_rete.exists_node import ExistsNode
+from py_rete.exists_node import ConjunctiveExistsNode
+from py_rete.aggregate_node import AggregateNode
 from py_rete.join_node import JoinNode
+from py_rete.memory_join_node import MemoryJoinNode
 from py_rete.pnode import PNode
+from py_rete.agenda import make_agenda
 from py_rete.common import WME
+from py_rete.common import FactWME
 from py_rete.common import V
 from py_rete.common import Match
+from py_rete.common import OrderedSet
 from py_rete.fact import Fact
 from py_rete.alpha import AlphaMemory
+from py_rete.alpha import AlphaIndex
+from py_rete.alpha import FactIndex
+from py_rete.alpha import ValueIndex
 from py_rete.beta import ReteNode
 from py_rete.beta import BetaMemory
 from py_rete.conditions import Cond
 from py_rete.conditions import Ncc
 from py_rete.conditions import Neg
+from py_rete.conditions import Exists
+from py_rete.conditions import Aggregate
+from py_rete.conditions import FactCond
+from py_rete.conditions import Predicate
 from py_rete.conditions import Filter
 from py_rete.conditions import Bind
 from py_rete.production import Production
+from py_rete.ordering import order_conditions
 
 if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Callable
+    from typing import Deque
     from typing import Optional
     from typing import Generator
     from typing import Dict
-    from typing import Tuple
     from typing import List
+    from typing import Tuple
     from typing import Set
+    from typing import KeysView
     from typing import Union
     from typing import Hashable
+    from typing import Iterable
+    from py_rete.common import Token
 
 
 class ReteNetwork:
     """
     A Rete Network to store all the facts and productions to compute matches.
-    """
 
-    def __init__(self):
-        self.alpha_hash: Dict[
-            Tuple[Hashable, Hashable, Hashable], AlphaMemory] = {}
+    If whole_facts is True, then each fact is added as a single FactWME and
+    each Fact pattern is matched by a single FactCond, instead of decomposing
+    them into one WME/condition per slot and rejoining them on the fact's
+    identifier.
+
+    If merge_memories is True, then each positive condition is matched by a
+    MemoryJoinNode that stores its own tokens, instead of a BetaMemory
+    followed by a JoinNode.
+
+    The strategy is the conflict resolution strategy of the agenda, which
+    selects the match to fire next in run: 'random', 'depth', 'breadth', 'lex',
+    or 'mea'.
+
+    If deferred is True, then adding, removing, and updating facts and wmes
+    only queues the change (and ids are still given to facts right away). The
+    changes, and the activations they make, are processed in bounded steps
+    with step, so that the caller can do other work in between. Run and
+    adding or removing productions first process all of the pending work.
+
+    If reorder is True, then the conditions of each production are reordered
+    when it is added, using the sizes of their alpha memories (see
+    order_conditions and condition_cost). If replan is given (a ratio, which
+    implies reorder), then the productions are also re-planned, and rebuilt
+    if their order changed, once the size of one of the alpha memories they
+    were planned with changes by more than that ratio. This is checked every
+    replan_interval wme changes.
+    """
+    replan_interval = 1000
+
+    def __init__(self, whole_facts: bool = False,
+                 merge_memories: bool = False, strategy: str = 'random',
+                 deferred: bool = False, reorder: bool = False,
+                 replan: Optional[float] = None):
+        self.whole_facts = whole_facts
+        self.merge_memories = merge_memories
+        self.deferred = deferred
+        self.reorder = reorder or replan is not None
+        self.replan = replan
+        # The planned conditions of each production (if replan is given), and
+        # the sizes of the alpha memories they were planned with.
+        self.plans: Dict[Production, Tuple[List[List[Any]],
+                                           List[Tuple[Cond, int]]]] = {}
+        self.changes = 0
+        # The queued changes of a deferred network, and the activations of
+        # the change being processed (see step).
+        self.pending_operations: Deque[Tuple[Callable, Tuple[Any, ...]]] = (
+            deque())
+        self.pending_activations: List[Tuple[ReteNode, Any, Any,
+                                             Tuple[Any, ...]]] = []
+        self.starting_operation = False
+        self.nested_operations: Optional[List[Tuple[Callable,
+                                                    Tuple[Any, ...]]]] = None
+        self.agenda = make_agenda(strategy)
+        self.alpha_hash: Dict[Hashable, AlphaMemory] = {}
+        self.alpha_index = AlphaIndex()
+        self.fact_index = FactIndex()
         self.beta_root = ReteNode()
+        # Runs the left activations of the network's nodes (see Activations).
+        self.activator = self.beta_root.activator
         self.buf = None
         self.pnodes: List[PNode] = []
-        self.working_memory: Set[WME] = set()
+        self.working_memory: Dict[WME, WME] = {}
+        self.fact_wmes: Dict[Hashable, OrderedSet] = {}
         self.facts: Dict[str, Fact] = {}
         self.fact_counter: int = 0
+        self.wme_counter: int = 0
         self.production_counter: int = 0
         self.productions: Set[Production] = set()
-
-    def run(self, n: int = 10) -> None:
+        # While adding a batch of productions, new alpha memories are
+        # collected here and filled afterwards (see add_productions).
+        self.new_alpha_memories: Optional[List[Tuple[Cond,
+                                                     AlphaMemory]]] = None
+        # Sorted indexes of the wmes by value, kept for the attributes that
+        # predicate conditions test (see get_value_index).
+        self.value_indexes: Dict[Hashable, ValueIndex] = {}
+
+    def run(self, n: Optional[int] = 10) -> None:
         """
-        First n rules, chosen at random. After each rule is fired the facts are
-        updated and new matches computed.
+        Fires n rules, chosen from the agenda by the conflict resolution
+        strategy. After each rule is fired the facts are updated and new
+        matches computed. Matches that have fired are not selected again
+        (until they are retracted and matched again), and it stops early when
+        there are no unfired matches left. If n is None, then it runs until
+        there are no unfired matches left.
         """
-        while n > 0:
-            matches = list(self.matches)
-            if len(matches) <= 0:
+        while n is None or n > 0:
+            self.step()
+            match = self.agenda.select()
+            if match is None:
                 break
-            match = random.choice(matches)
             match.fire()
-            n -= 1
+            if n is not None:
+                n -= 1
 
     def __repr__(self):
         output = 'Productions:\n'
@@ -81,18 +169,21 @@ class ReteNetwork:
             output += "{}\n".format(wme)
         return output
 
-    def num_nodes(self):
-        def get_nodes(node):
-            if len(node.children) == 0:
-                return [node]
-
-            nodes = [node]
-            for c in node.children:
-                nodes += get_nodes(c)
-            return nodes
+    def get_beta_nodes(self) -> List[ReteNode]:
+        """
+        Returns the beta network nodes that are reachable from the root
+        (through the children of each node), in depth first order.
+        """
+        nodes = []
+        stack = [self.beta_root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(reversed(node.children))
+        return nodes
 
-        nodes = get_nodes(self.beta_root)
-        return len(nodes)
+    def num_nodes(self):
+        return len(self.get_beta_nodes())
 
     def render_graph(self):
         import networkx as nx
@@ -102,15 +193,6 @@ class ReteNetwork:
         G = nx.DiGraph()
         G.add_node("root")
 
-        def get_nodes(node):
-            if len(node.children) == 0:
-                return [node]
-
-            nodes = [node]
-            for c in node.children:
-                nodes += get_nodes(c)
-            return nodes
-
         def get_label(node):
             if isinstance(node, JoinNode):
                 return (node, node.condition)
@@ -131,7 +213,7 @@ class ReteNetwork:
             G.add_node(get_label(self.alpha_hash[k]))
             G.add_edge("root", get_label(self.alpha_hash[k]))
 
-        nodes = get_nodes(self.beta_root)
+        nodes = self.get_beta_nodes()
         print('nodes', len(nodes))
         for n in nodes:
             G.add_node(get_label(n))
@@ -154,12 +236,7 @@ class ReteNetwork:
         if fact.id is not None:
             raise ValueError("Fact already has an id, cannot add")
 
-        copy = fact.duplicate()
-        for k in copy:
-            if isinstance(copy[k], Fact):
-                if copy[k].id is None:
-                    self.add_fact(copy[k])
-                copy[k] = copy[k].id
+        copy = self.flatten_fact(fact)
 
         fact.id = "f-{}".format(self.fact_counter)
         copy.id = fact.id
@@ -167,9 +244,58 @@ class ReteNetwork:
 
         self.facts[fact.id] = fact
 
-        for wme in copy.wmes:
+        for wme in self.get_fact_wmes(copy):
             self.add_wme(wme)
 
+    def add_facts(self, facts: Iterable[Fact]) -> None:
+        """
+        Adds a batch of facts to the network, their wmes are added together
+        with add_wmes. All the facts are checked before any are added.
+        """
+        facts = list(facts)
+        seen: Set[int] = set()
+        for fact in facts:
+            if fact.id is not None:
+                raise ValueError("Fact already has an id, cannot add")
+            if id(fact) in seen:
+                raise ValueError("Fact appears more than once in the batch.")
+            seen.add(id(fact))
+
+        wmes: List[WME] = []
+        for fact in facts:
+            copy = self.flatten_fact(fact)
+
+            fact.id = "f-{}".format(self.fact_counter)
+            copy.id = fact.id
+            self.fact_counter += 1
+
+            self.facts[fact.id] = fact
+            wmes.extend(self.get_fact_wmes(copy))
+
+        self.add_wmes(wmes)
+
+    def get_fact_wmes(self, fact: Fact) -> List[WME]:
+        """
+        Returns the WMEs for a (flattened) fact, either a single FactWME or one
+        WME per slot, depending on whether the network matches whole facts.
+        """
+        if self.whole_facts:
+            return [fact.fact_wme]
+        return list(fact.wmes)
+
+    def flatten_fact(self, fact: Fact) -> Fact:
+        """
+        Returns a copy of the fact where nested facts are replaced by their
+        ids. Nested facts that are not yet in the network are added to it.
+        """
+        copy = fact.duplicate()
+        for k in copy:
+            if isinstance(copy[k], Fact):
+                if copy[k].id is None:
+                    self.add_fact(copy[k])
+                copy[k] = copy[k].id
+        return copy
+
     def remove_fact(self, fact: Fact) -> None:
         """
         Removes a fact from the network.
@@ -183,31 +309,92 @@ class ReteNetwork:
 
         fact.id = None
 
+    def remove_facts(self, facts: Iterable[Fact]) -> None:
+        """
+        Removes a batch of facts from the network. All the facts are checked
+        before any are removed.
+        """
+        facts = list(facts)
+        seen: Set[str] = set()
+        for fact in facts:
+            if fact.id is None or fact.id not in self.facts:
+                raise ValueError("Fact has no id or does not exist in "
+                                 "network.")
+            if fact.id in seen:
+                raise ValueError("Fact appears more than once in the batch.")
+            seen.add(fact.id)
+
+        for fact in facts:
+            self.remove_fact(fact)
+
     def get_fact_by_id(self, fact_id: str) -> Fact:
         return self.facts[fact_id]
 
     def update_fact(self, fact: Fact) -> None:
-        # TODO: Figure out a fancy way to only update part of the fact
-        self.remove_fact(fact)
-        self.add_fact(fact)
+        """
+        Updates a fact that has been modified since it was added to the
+        network. Only the WMEs whose values changed are removed and added, so
+        the fact keeps its id and the tokens built from its unchanged WMEs are
+        left alone.
+        """
+        if fact.id is None or fact.id not in self.facts:
+            raise ValueError("Fact has no id or does not exist in network.")
 
-    def remove_wme_by_fact_id(self, identifier: str) -> None:
-        to_remove = [wme for wme in self.working_memory if wme.identifier ==
-                     identifier]
-        for wme in to_remove:
+        copy = self.flatten_fact(fact)
+        copy.id = fact.id
+        self.update_fact_wmes(fact.id, self.get_fact_wmes(copy))
+
+    def update_fact_wmes(self, identifier: str, wmes: List[WME]) -> None:
+        """
+        Replaces the wmes of a fact with wmes, only removing and adding the
+        ones that changed.
+        """
+        if self.defer(self.update_fact_wmes, identifier, wmes):
+            return
+
+        current = set(wmes)
+        stale = [wme for wme in self.fact_wmes.get(identifier, ())
+                 if wme not in current]
+        for wme in stale:
             self.remove_wme(wme)
 
+        for wme in wmes:
+            self.add_wme(wme)
+
+    def remove_wme_by_fact_id(self, identifier: str) -> None:
+        if self.defer(self.remove_wme_by_fact_id, identifier):
+            return
+        if identifier in self.fact_wmes:
+            for wme in list(self.fact_wmes[identifier]):
+                self.remove_wme(wme)
+
     def get_new_match(self) -> Optional[Match]:
+        """
+        Returns (and removes from the new matches) the most recent new match of
+        the productions with the highest salience.
+        """
+        best = None
+        best_salience = None
         for pnode in self.pnodes:
-            if pnode.new:
-                t = pnode.pop_new_token()
-                return Match(pnode, t)
-        return None
+            for t in reversed(pnode.new):
+                if t not in pnode.new_members:
+                    continue
+                salience = pnode.production.get_salience(t)
+                if best_salience is None or salience > best_salience:
+                    best = (pnode, t)
+                    best_salience = salience
+                if not callable(pnode.production.salience):
+                    break
+        if best is None:
+            return None
+        pnode, t = best
+        pnode.remove_new(t)
+        return Match(pnode, t)
 
     @property
     def new_matches(self) -> Generator[Match, None, None]:
         for pnode in self.pnodes:
-            for t in pnode.new:
+            for t in pnode.new_tokens:
                 yield Match(pnode, t)
 
     @property
@@ -217,8 +404,82 @@ class ReteNetwork:
                 yield Match(pnode, t)
 
     @property
-    def wmes(self) -> Set[WME]:
-        return self.working_memory
+    def wmes(self) -> KeysView[WME]:
+        return self.working_memory.keys()
+
+    def defer(self, operation: Callable, *args: Any) -> bool:
+        """
+        Queues a change (the operation and its arguments) to be processed by
+        step, if the network is deferred. Returns whether it was queued.
+
+        When step processes a change, the change itself is not queued again,
+        but the changes that it makes (e.g., the wmes of an updated fact, or
+        the alpha memories that a wme is added to) are queued to be processed
+        next, in order. So the activations of each alpha memory are all run
+        before the next one is activated, as when the network is not deferred
+        (otherwise a join could match a token that is still to be passed to
+        it).
+        """
+        if not self.deferred:
+            return False
+        if self.starting_operation:
+            self.starting_operation = False
+            return False
+        if self.nested_operations is not None:
+            self.nested_operations.append((operation, args))
+        else:
+            self.pending_operations.append((operation, args))
+        return True
+
+    def pending_work(self) -> int:
+        """
+        The number of queued changes and pending activations left to process.
+        """
+        return len(self.pending_operations) + len(self.pending_activations)
+
+    def step(self, budget: Optional[int] = None,
+             seconds: Optional[float] = None) -> int:
+        """
+        Processes the pending work of a deferred network: the queued changes,
+        in the order they were made, and the left activations they make. It
+        stops after budget activations (a queued change counts as one) or
+        once seconds have passed, and the rest is left for the next step. If
+        both are None, then all of the pending work is processed. Returns the
+        amount of work left (see pending_work).
+
+        A change is only started once the activations of the previous one
+        have all been run, so the changes are applied in order. Between steps,
+        the matches are those of the work processed so far (matches that only
+        depend on the rest can still be added or removed).
+        """
+        deadline = None if seconds is None else perf_counter() + seconds
+        while budget is None or budget > 0:
+            if deadline is not None and perf_counter() >= deadline:
+                break
+            if self.pending_activations:
+                done = self.activator.run(self.pending_activations, budget,
+                                          deadline)
+            elif self.pending_operations:
+                operation, args = self.pending_operations.popleft()
+                self.starting_operation = True
+                self.nested_operations = nested = []
+                outer = self.activator.stack
+                self.activator.stack = self.pending_activations
+                try:
+                    operation(*args)
+                finally:
+                    self.activator.stack = outer
+                    self.starting_operation = False
+                    self.nested_operations = None
+                self.pending_operations.extendleft(reversed(nested))
+                done = 1
+            else:
+                break
+            if budget is not None:
+                budget -= done
+        if not self.pending_work():
+            self.check_plans()
+        return self.pending_work()
 
     def add_production(self, prod: Production) -> None:
         """
@@ -227,13 +488,27 @@ class ReteNetwork:
         if prod.id is not None:
             raise ValueError("Production already has an id, cannot add")
 
+        self.step()
         prod.id = "p-{}".format(self.production_counter)
         prod._rete_net = self
 
         self.production_counter += 1
         self.productions.add(prod)
 
-        for conds in prod.get_rete_conds():
+        plans = prod.get_rete_conds(self.whole_facts)
+        if self.reorder:
+            plans = [self.plan_conditions(conds) for conds in plans]
+        self.build_production(prod, plans)
+        if self.replan is not None:
+            self.plans[prod] = (plans, self.plan_sizes(plans))
+
+    def build_production(self, prod: Production,
+                         plans: List[List[Any]]) -> None:
+        """
+        Builds (or shares) the nodes for each of the production's lists of
+        conditions (one per disjunct).
+        """
+        for conds in plans:
             current_node = self.build_or_share_network_for_conditions(
                 self.beta_root, conds, [])
             p_node = self.build_or_share_p(current_node, prod)
@@ -241,6 +516,177 @@ class ReteNetwork:
             self.pnodes.append(p_node)
             prod.p_nodes.append(p_node)
 
+    def plan_conditions(self, conds: List[Any]) -> List[Any]:
+        """
+        Reorders a list of conditions with the network's statistics (see
+        order_conditions).
+        """
+        return order_conditions(conds, self.condition_cost)
+
+    def condition_cost(self, cond: Cond, bound: Set[V]) -> float:
+        """
+        Estimates the number of matches of a positive condition per match of
+        the conditions before it, given the variables bound by them. This is
+        the size of the condition's alpha memory (which is built if needed),
+        divided, for each field with a bound variable, by the number of
+        distinct values in the field if the memory has an index on it.
+
+        When there are no wmes (or the memory is not filled yet, see
+        add_productions), the sizes are estimated instead, by assuming that
+        each constant (or bound variable without an index) only matches a
+        tenth of the wmes and each predicate half of them (the class in a
+        fact's type condition is not counted, as every fact has one).
+        """
+        am = self.build_or_share_alpha_memory(cond)
+        live = bool(self.working_memory) and not (
+            self.new_alpha_memories is not None and
+            any(am is new for _, new in self.new_alpha_memories))
+        if live:
+            size = float(len(am.items))
+        else:
+            if isinstance(cond, FactCond):
+                patterns = [p for _, p in cond.value]
+            else:
+                patterns = [cond.identifier, cond.attribute]
+                if cond.attribute != '__fact_type__':
+                    patterns.append(cond.value)
+            size = 1000.0
+            for pattern in patterns:
+                if isinstance(pattern, Predicate):
+                    size *= 0.5
+                elif not isinstance(pattern, V):
+                    size *= 0.1
+        for field, v in cond.vars:
+            if v in bound:
+                index = am.indexes.get(field) if live else None
+                size = size / len(index) if index else size * 0.1
+        return size
+
+    def plan_sizes(self, plans: List[List[Any]]) -> List[Tuple[Cond, int]]:
+        """
+        Returns the current sizes of the alpha memories of the positive
+        conditions of the plans (see check_plans).
+        """
+        return [(cond, len(self.build_or_share_alpha_memory(cond).items))
+                for conds in plans for cond in conds
+                if isinstance(cond, Cond) and not isinstance(cond, Neg)]
+
+    def check_plans(self) -> None:
+        """
+        Re-plans the productions whose alpha memory sizes changed by more
+        than the replan ratio since they were planned, if there have been
+        replan_interval wme changes since the last check. Nothing is done
+        while a change is being propagated.
+        """
+        if (self.replan is None or self.changes < self.replan_interval or
+                self.activator.stack is not None or
+                self.nested_operations is not None):
+            return
+        self.changes = 0
+        for prod, (_, sizes) in list(self.plans.items()):
+            for cond, size in sizes:
+                current = len(self.build_or_share_alpha_memory(cond).items)
+                ratio = (max(current, size) + 1) / (min(current, size) + 1)
+                if ratio > self.replan:
+                    self.replan_production(prod)
+                    break
+
+    def replan_production(self, prod: Production) -> bool:
+        """
+        Re-plans the order of a production's conditions with the current
+        statistics. If the order changed, then the production's nodes are
+        rebuilt, and its matches that were fired or taken from the new
+        matches (compared by their bindings) are marked so again. Returns
+        whether it was rebuilt.
+        """
+        plans = [self.plan_conditions(conds)
+                 for conds in prod.get_rete_conds(self.whole_facts)]
+        rebuild = plans != self.plans[prod][0]
+        if rebuild:
+            fired: Dict[Hashable, int] = {}
+            taken: Dict[Hashable, int] = {}
+            for pnode in prod.p_nodes:
+                for token in pnode.items:
+                    if token in pnode.fired:
+                        counts = fired
+                    elif token not in pnode.new_members:
+                        counts = taken
+                    else:
+                        continue
+                    key = self.match_key(token)
+                    counts[key] = counts.get(key, 0) + 1
+                self.delete_node_and_any_unused_ancestors(pnode)
+                self.pnodes.remove(pnode)
+            prod.p_nodes = []
+            self.build_production(prod, plans)
+
+            for pnode in prod.p_nodes:
+                for token in list(pnode.items):
+                    key = self.match_key(token)
+                    if fired.get(key):
+                        fired[key] -= 1
+                        pnode.refract(token)
+                        pnode.remove_new(token)
+                    elif taken.get(key):
+                        taken[key] -= 1
+                        pnode.remove_new(token)
+
+        self.plans[prod] = (plans, self.plan_sizes(plans))
+        return rebuild
+
+    @staticmethod
+    def match_key(token: Token) -> Hashable:
+        """
+        A key for a match that does not depend on the order of the
+        conditions: its bindings (or their repr, if a value is not
+        hashable).
+        """
+        key = tuple(sorted(token.binding.items(), key=lambda b: b[0].name))
+        try:
+            hash(key)
+        except TypeError:
+            return repr(key)
+        return key
+
+    def add_productions(self, prods: Iterable[Production]) -> None:
+        """
+        Adds a batch of productions to the ReteNetwork. All the nodes are built
+        first, with the new alpha memories left empty. Then the new alpha
+        memories are filled in a single pass over the working memory and each
+        one right activates its successors with all of its wmes at once (see
+        AlphaMemory.batch_activation), which fills in the new beta nodes.
+        """
+        self.step()
+        self.new_alpha_memories = []
+        try:
+            for prod in prods:
+                self.add_production(prod)
+            new_alpha_memories = self.new_alpha_memories
+        finally:
+            self.new_alpha_memories = None
+
+        alpha_index = AlphaIndex()
+        fact_index = FactIndex()
+        for condition, amem in new_alpha_memories:
+            if isinstance(condition, FactCond):
+                fact_index.add(condition, amem)
+            else:
+                alpha_index.add(amem.key, amem)
+
+        batches: Dict[AlphaMemory, List[WME]] = {}
+        for wme in self.working_memory:
+            if isinstance(wme, FactWME):
+                amems = fact_index.matching_memories(wme)
+            else:
+                amems = alpha_index.matching_memories(wme)
+            for am in amems:
+                if am not in batches:
+                    batches[am] = []
+                batches[am].append(wme)
+
+        for am, batch in batches.items():
+            am.batch_activation(batch)
+
     def remove_production(self, prod: Production) -> None:
         """
         Removes a pnode from the network
@@ -248,8 +694,10 @@ class ReteNetwork:
         if prod.id is None:
             raise ValueError("Production has no id, cannot remove.")
 
+        self.step()
         # Remove production
         self.productions.remove(prod)
+        self.plans.pop(prod, None)
 
         for pnode in prod.p_nodes:
             self.delete_node_and_any_unused_ancestors(pnode)
@@ -259,9 +707,63 @@ class ReteNetwork:
         prod.p_nodes = []
 
     def add_wme(self, wme: WME) -> None:
+        if self.defer(self.add_wme, wme):
+            return
         if wme in self.working_memory:
             return
 
+        for am in self.get_alpha_memories(wme):
+            self.alpha_activation(am, wme)
+
+        self.store_wme(wme)
+        self.check_plans()
+
+    def add_wmes(self, wmes: Iterable[WME]) -> None:
+        """
+        Adds a batch of wmes to the network. The wmes are grouped by alpha
+        memory and each alpha memory right activates its join nodes once with
+        all of its new wmes, so they can be joined together.
+        """
+        if self.defer(self.add_wmes, list(wmes)):
+            return
+        batches: Dict[AlphaMemory, List[WME]] = {}
+        for wme in wmes:
+            if wme in self.working_memory:
+                continue
+
+            for am in self.get_alpha_memories(wme):
+                if am not in batches:
+                    batches[am] = []
+                batches[am].append(wme)
+
+            self.store_wme(wme)
+
+        for am, batch in batches.items():
+            self.batch_activation(am, batch)
+        self.check_plans()
+
+    def alpha_activation(self, am: AlphaMemory, wme: WME) -> None:
+        """
+        Adds a wme to an alpha memory (see add_wme).
+        """
+        if self.defer(self.alpha_activation, am, wme):
+            return
+        am.activation(wme)
+
+    def batch_activation(self, am: AlphaMemory, wmes: List[WME]) -> None:
+        """
+        Adds a batch of wmes to an alpha memory (see add_wmes).
+        """
+        if self.defer(self.batch_activation, am, wmes):
+            return
+        am.batch_activation(wmes)
+
+    def get_alpha_memories(self, wme: WME
+                           ) -> Generator[AlphaMemory, None, None]:
+        """
+        Checks a new wme, gives it a timetag, and returns the alpha memories
+        it should be added to.
+        """
         if (wme.identifier == '#*#' or
                 wme.attribute == '#*#' or
                 wme.value == '#*#'):
@@ -269,40 +771,110 @@ class ReteNetwork:
                              "the wild card match symbol used internally by "
                              "py_rete.")
 
-        keys = product([wme.identifier, '#*#'],
-                       [wme.attribute, '#*#'],
-                       [wme.value, '#*#'])
+        self.wme_counter += 1
+        wme.timetag = self.wme_counter
 
-        for key in keys:
-            if key in self.alpha_hash:
-                self.alpha_hash[key].activation(wme)
+        if isinstance(wme, FactWME):
+            return self.fact_index.matching_memories(wme)
+        return self.alpha_index.matching_memories(wme)
 
-        self.working_memory.add(wme)
+    def store_wme(self, wme: WME) -> None:
+        """
+        Adds a wme to the working memory and the per fact index.
+        """
+        self.working_memory[wme] = wme
+        self.changes += 1
+        if wme.identifier not in self.fact_wmes:
+            self.fact_wmes[wme.identifier] = OrderedSet()
+        self.fact_wmes[wme.identifier].append(wme)
+        if (self.value_indexes and wme.attribute in self.value_indexes and
+                not isinstance(wme, FactWME)):
+            self.value_indexes[wme.attribute].add(wme)
 
     def remove_wme(self, wme: WME) -> None:
-        for stored_wme in self.working_memory:
-            if wme == stored_wme:
-                wme = stored_wme
+        if self.defer(self.remove_wme, wme):
+            return
+        wme = self.working_memory[wme]
 
         for am in wme.amems:
-            am.items.remove(wme)
+            am.remove(wme)
             if not am.items:
                 for node in am.successors:
                     if (isinstance(node, JoinNode) and
                             not isinstance(node, NegativeNode)):
                         node.parent.children.remove(node)
 
+        # The negative (and exists) nodes are deactivated before the wme's
+        # tokens are deleted, as deleting them can add tokens to these nodes
+        # (e.g., when an ncc result is removed) that never counted the
+        # wme.
+        for am in wme.amems:
+            for node in list(am.successors):
+                if isinstance(node, NegativeNode):
+                    node.right_deactivation(wme)
+
         while wme.tokens:
             wme.tokens[0].delete_token_and_descendents()
 
-        for jr in wme.negative_join_results:
-            jr.owner.join_results.remove(jr)
-            if not jr.owner.join_results:
-                if jr.owner.node and jr.owner.node.children is not None:
-                    for child in jr.owner.node.children:
-                        child.left_activation(jr.owner, None, jr.owner.binding)
+        wme.amems = OrderedSet()
+        del self.working_memory[wme]
+        self.fact_wmes[wme.identifier].remove(wme)
+        if not self.fact_wmes[wme.identifier]:
+            del self.fact_wmes[wme.identifier]
+        if (self.value_indexes and wme.attribute in self.value_indexes and
+                not isinstance(wme, FactWME)):
+            self.value_indexes[wme.attribute].remove(wme)
+        self.changes += 1
+        self.check_plans()
+
+    @staticmethod
+    def uses_value_index(condition: Cond) -> bool:
+        """
+        Returns whether the wmes that match a condition are found with a value
+        index: it has a constant attribute and a predicate on the value (e.g.,
+        a range).
+        """
+        return (not isinstance(condition, FactCond) and
+                isinstance(condition.value, Predicate) and
+                not isinstance(condition.attribute, (V, Predicate)))
+
+    def get_value_index(self, attribute: Hashable) -> ValueIndex:
+        """
+        Returns the sorted index of the wmes with the given attribute by
+        value, it is built (with one pass over the working memory) the first
+        time it is needed. It is kept up to date while the alpha memories
+        that were filled from it are in use (see delete_alpha_memory).
+
+        Once the last of these memories is deleted, the index is dropped
+        rather than maintained for wmes nobody looks up. So the lookups only
+        cost O(log n + k) while the index exists. A range or IN condition
+        added after that pays for a new pass over the working memory, even
+        if it is the same condition that was just removed.
+        """
+        if attribute not in self.value_indexes:
+            self.value_indexes[attribute] = ValueIndex(
+                w for w in self.working_memory
+                if w.attribute == attribute and not isinstance(w, FactWME))
+        return self.value_indexes[attribute]
 
-        self.working_memory.remove(wme)
+    def initial_matches(self, condition: Cond) -> Iterable[WME]:
+        """
+        Returns the wmes in the working memory that match a condition. As when
+        wmes are added (see get_alpha_memories), FactConds only match
+        FactWMEs and other conditions only match plain WMEs. If the condition
+        has a constant attribute and a predicate on the value (e.g., a
+        range), then the candidates come from the attribute's value index.
+        """
+        if isinstance(condition, FactCond):
+            return (w for w in self.working_memory
+                    if isinstance(w, FactWME) and condition.test(w))
+        if self.uses_value_index(condition):
+            wmes = self.get_value_index(condition.attribute).matching(
+                condition.value)
+            if wmes is not None:
+                return (w for w in wmes if condition.test(w))
+        return (w for w in self.working_memory
+                if not isinstance(w, FactWME) and condition.test(w))
 
     def build_or_share_alpha_memory(self, condition):
         """
@@ -320,36 +892,52 @@ class ReteNetwork:
                              "the wild card match symbol used internally by "
                              "py_rete.")
 
-        if not isinstance(condition.identifier, V):
-            id_test = condition.identifier
-        if not isinstance(condition.attribute, V):
-            attr_test = condition.attribute
-        if not isinstance(condition.value, V):
-            value_test = condition.value
+        if isinstance(condition, FactCond):
+            key = condition.alpha_key
+        else:
+            if not isinstance(condition.identifier, V):
+                id_test = condition.identifier
+            if not isinstance(condition.attribute, V):
+                attr_test = condition.attribute
+            if not isinstance(condition.value, V):
+                value_test = condition.value
 
-        key = (id_test, attr_test, value_test)
+            key = (id_test, attr_test, value_test)
 
         if key in self.alpha_hash:
             return self.alpha_hash[key]
 
         self.alpha_hash[key] = AlphaMemory()
         self.alpha_hash[key].key = key
-
-        for w in self.working_memory:
-            if condition.test(w):
+        if isinstance(condition, FactCond):
+            self.fact_index.add(condition, self.alpha_hash[key])
+        else:
+            self.alpha_index.add(key, self.alpha_hash[key])
+
+        if self.new_alpha_memories is not None:
+            self.new_alpha_memories.append((condition, self.alpha_hash[key]))
+        else:
+            for w in self.initial_matches(condition):
                 self.alpha_hash[key].activation(w)
+            if self.uses_value_index(condition):
+                index = self.value_indexes[condition.attribute]
+                index.reference_count += 1
+                self.alpha_hash[key].value_index = index
 
         return self.alpha_hash[key]
 
     def build_or_share_join_node(self, parent: BetaMemory, amem: AlphaMemory,
                                  condition: Cond) -> JoinNode:
+        join_class = MemoryJoinNode if self.merge_memories else JoinNode
 
         for child in parent.all_children:
-            if (type(child) == JoinNode and child.amem == amem and
+            if (type(child) is join_class and child.amem == amem and
                     child.condition == condition):
                 return child
-        node = JoinNode(children=[], parent=parent, amem=amem,
-                        condition=condition)
+        node = join_class(children=[], parent=parent, amem=amem,
+                          condition=condition, bound_vars=parent.slots)
+        if isinstance(node, MemoryJoinNode):
+            node.update_from_above()
         parent.children.append(node)
         parent.all_children.append(node)
         amem.successors.append(node)
@@ -363,70 +951,156 @@ class ReteNetwork:
         return node
 
     def build_or_share_negative_node(self, parent: JoinNode, amem: AlphaMemory,
-                                     condition: Neg) -> NegativeNode:
-
+                                     condition: Neg,
+                                     node_class: type = NegativeNode
+                                     ) -> NegativeNode:
+        """
+        Builds (or shares) a negative node, or an exists node if node_class
+        is ExistsNode.
+        """
         for child in parent.children:
-            if (isinstance(child, NegativeNode) and child.amem == amem and
+            if (type(child) is node_class and child.amem == amem and
                     child.condition == condition):
                 return child
-        node = NegativeNode(parent=parent, amem=amem, condition=condition)
-        parent.children.append(node)
-        amem.successors.append(node)
+        node = node_class(parent=parent, amem=amem, condition=condition,
+                          bound_vars=parent.slots)
+        self.link_child(parent, node)
 
         amem.reference_count += 1
         node.update_nearest_ancestor_with_same_amem()
+        # The node is linked to the alpha memory by its first left activation
+        # (it is right unlinked while it has no tokens).
         self.update_new_node_with_matches_from_above(node)
-        if not node.items:
-            amem.successors.remove(node)
 
         return node
 
+    @staticmethod
+    def link_child(parent: ReteNode, node: ReteNode,
+                   first: bool = False) -> None:
+        """
+        Adds a node (other than a join node) to the children of its parent.
+        Memory join nodes also track these in all_children, as their children
+        can be a mix of join nodes (which may be unlinked) and other nodes.
+        """
+        if first:
+            parent.children.insert(0, node)
+        else:
+            parent.children.append(node)
+        if isinstance(parent, MemoryJoinNode):
+            parent.all_children.append(node)
+
     def build_or_share_beta_memory(self, parent: ReteNode) -> BetaMemory:
         for child in parent.children:
             # if isinstance(child, BetaMemory):  # Don't include subclasses
-            if type(child) == BetaMemory:
+            if type(child) is BetaMemory:
                 return child
         node = BetaMemory(parent=parent)
-        parent.children.append(node)
+        self.link_child(parent, node)
         self.update_new_node_with_matches_from_above(node)
         return node
 
     def build_or_share_p(self, parent: ReteNode, prod: Production) -> PNode:
         for child in parent.children:
-            if isinstance(child, PNode):
+            if isinstance(child, PNode) and child.production is prod:
                 return child
-        node = PNode(production=prod, parent=parent)
-        parent.children.append(node)
+        node = PNode(production=prod, agenda=self.agenda, parent=parent)
+        self.link_child(parent, node)
         self.update_new_node_with_matches_from_above(node)
         return node
 
-    def build_or_share_ncc_nodes(self, parent: JoinNode, ncc: Ncc,
-                                 earlier_conds: List[Cond]
-                                 ) -> NccNode:
+    def build_or_share_ncc_nodes(self, parent: JoinNode,
+                                 ncc: Union[Ncc, Exists],
+                                 earlier_conds: List[Cond],
+                                 node_class: type = NccNode) -> NccNode:
+        """
+        Builds (or shares) an ncc node and its partner, or a conjunctive
+        exists node if node_class is ConjunctiveExistsNode.
+        """
         bottom_of_subnetwork = self.build_or_share_network_for_conditions(
             parent, ncc, earlier_conds)
         for child in parent.children:
-            if (isinstance(child, NccNode) and child.partner.parent ==
+            if (type(child) is node_class and child.partner.parent ==
                     bottom_of_subnetwork):
                 return child
 
-        ncc_partner = NccPartnerNode(parent=bottom_of_subnetwork)
-        ncc_node = NccNode(partner=ncc_partner, children=[], parent=parent)
+        ncc_partner = self.build_ncc_partner(parent, bottom_of_subnetwork,
+                                             ncc.number_of_conditions)
+        ncc_node = node_class(partner=ncc_partner, children=[],
+                              parent=parent)
         ncc_partner.ncc_node = ncc_node
-        parent.children.insert(0, ncc_node)
-        bottom_of_subnetwork.children.append(ncc_partner)
-        ncc_partner.number_of_conditions = ncc.number_of_conditions
+        self.link_child(parent, ncc_node, first=True)
+        self.link_child(bottom_of_subnetwork, ncc_partner)
         self.update_new_node_with_matches_from_above(ncc_node)
         self.update_new_node_with_matches_from_above(ncc_partner)
         return ncc_node
 
+    def build_ncc_partner(self, parent: ReteNode,
+                          bottom_of_subnetwork: ReteNode,
+                          number_of_conditions: int) -> NccPartnerNode:
+        """
+        Builds the partner node for a subnetwork. If memories are merged and
+        the parent is not a memory join node, then the subnetwork starts with
+        a beta memory, which adds a step to the walk back to the owner. If the
+        parent is a memory join node, then its children do not get the wme,
+        so owners are only identified by their parent token.
+        """
+        parent_merged = isinstance(parent, MemoryJoinNode)
+        if self.merge_memories and not parent_merged:
+            number_of_conditions += 1
+        return NccPartnerNode(parent=bottom_of_subnetwork,
+                              number_of_conditions=number_of_conditions,
+                              match_wme=not parent_merged)
+
+    def build_or_share_exists_nodes(self, parent: ReteNode, exists: Exists,
+                                    earlier_conds: List[Cond]) -> ReteNode:
+        """
+        Builds (or shares) the nodes for an existential condition. A single
+        positive condition is counted directly against its alpha memory by an
+        ExistsNode, a conjunction is matched by a subnetwork and counted by a
+        ConjunctiveExistsNode.
+        """
+        if (len(exists) == 1 and isinstance(exists[0], Cond) and
+                not isinstance(exists[0], Neg)):
+            am = self.build_or_share_alpha_memory(exists[0])
+            return self.build_or_share_negative_node(parent, am, exists[0],
+                                                     node_class=ExistsNode)
+        return self.build_or_share_ncc_nodes(parent, exists, earlier_conds,
+                                             node_class=ConjunctiveExistsNode)
+
+    def build_or_share_aggregate_nodes(self, parent: ReteNode,
+                                       aggregate: Aggregate,
+                                       earlier_conds: List[Cond]
+                                       ) -> AggregateNode:
+        """
+        Builds (or shares) an aggregate node, its partner, and the subnetwork
+        for the aggregated conditions.
+        """
+        bottom_of_subnetwork = self.build_or_share_network_for_conditions(
+            parent, aggregate, earlier_conds)
+        for child in parent.children:
+            if (isinstance(child, AggregateNode) and
+                    child.partner.parent == bottom_of_subnetwork and
+                    child.aggregate == aggregate):
+                return child
+
+        partner = self.build_ncc_partner(parent, bottom_of_subnetwork,
+                                         aggregate.number_of_conditions)
+        node = AggregateNode(aggregate=aggregate, partner=partner,
+                             children=[], parent=parent)
+        partner.ncc_node = node
+        self.link_child(parent, node, first=True)
+        self.link_child(bottom_of_subnetwork, partner)
+        self.update_new_node_with_matches_from_above(node)
+        self.update_new_node_with_matches_from_above(partner)
+        return node
+
     def build_or_share_filter_node(self, parent: ReteNode,
                                    f: Filter) -> FilterNode:
         for child in parent.children:
             if isinstance(child, FilterNode) and child.func == f.func:
                 return child
         node = FilterNode([], parent, f.func, self)
-        parent.children.append(node)
+        self.link_child(parent, node)
         return node
 
     def build_or_share_bind_node(self, parent: ReteNode, b: Bind) -> BindNode:
@@ -435,7 +1109,7 @@ class ReteNetwork:
                     child.bind == b.to):
                 return child
         node = BindNode([], parent, b.func, b.to, self)
-        parent.children.append(node)
+        self.link_child(parent, node)
         return node
 
     def build_or_share_network_for_conditions(self, parent: ReteNode,
@@ -443,21 +1117,29 @@ class ReteNetwork:
                                               earlier_conds: List[Cond]
                                               ) -> ReteNode:
         current_node = parent
-        conds_higher_up = earlier_conds
+        conds_higher_up = list(earlier_conds)
         for cond in rule:
             if isinstance(cond, Cond) and not isinstance(cond, Neg):
-                current_node = self.build_or_share_beta_memory(current_node)
+                if not isinstance(current_node, MemoryJoinNode):
+                    current_node = self.build_or_share_beta_memory(
+                        current_node)
                 am = self.build_or_share_alpha_memory(cond)
                 current_node = self.build_or_share_join_node(current_node, am,
                                                              cond)
             elif isinstance(cond, Neg):
                 am = self.build_or_share_alpha_memory(cond)
-                current_node = self.build_or_share_negative_node(current_node,
-                                                                 am, cond)
+                current_node = self.build_or_share_negative_node(
+                    current_node, am, cond)
             elif isinstance(cond, Ncc):
                 current_node = self.build_or_share_ncc_nodes(current_node,
                                                              cond,
                                                              conds_higher_up)
+            elif isinstance(cond, Exists):
+                current_node = self.build_or_share_exists_nodes(
+                    current_node, cond, conds_higher_up)
+            elif isinstance(cond, Aggregate):
+                current_node = self.build_or_share_aggregate_nodes(
+                    current_node, cond, conds_higher_up)
             elif isinstance(cond, Filter):
                 current_node = self.build_or_share_filter_node(current_node,
                                                                cond)
@@ -471,7 +1153,10 @@ class ReteNetwork:
                                                 ) -> None:
         parent = new_node.parent
         if parent == self.beta_root:
-            new_node.left_activation(None, None, {})
+            new_node.left_activation(None, None, ())
+        elif isinstance(parent, MemoryJoinNode):
+            for tok in parent.items:
+                new_node.left_activation(tok, None, tok.values)
         elif (isinstance(parent, BetaMemory) and
                 not isinstance(parent, (NccNode, NegativeNode))):
             for tok in parent.items:
@@ -485,32 +1170,77 @@ class ReteNetwork:
             parent.children = saved_list_of_children
         elif isinstance(parent, NegativeNode):
             for token in parent.items:
-                if not token.join_results:
-                    new_node.left_activation(token, None, token.binding)
+                if parent.passes(token):
+                    new_node.left_activation(token, None, token.values)
+        elif isinstance(parent, AggregateNode):
+            for token in list(parent.outputs):
+                new_node.left_activation(token, None, token.values)
         elif isinstance(parent, NccNode):
             for token in parent.items:
-                if not token.ncc_results:
-                    new_node.left_activation(token, None, token.binding)
+                if parent.passes(token):
+                    new_node.left_activation(token, None, token.values)
         elif isinstance(parent, (BindNode, FilterNode)):
-            saved_list_of_children = parent.children
-            parent.children = [new_node]
-            self.update_new_node_with_matches_from_above(parent)
-            parent.children = saved_list_of_children
+            # Bind and filter nodes do not store tokens, so the matches come
+            # from the nearest ancestor that does, through the bind and
+            # filter nodes in between (which only pass them to the new node).
+            saved_lists_of_children = []
+            node = new_node
+            while isinstance(node.parent, (BindNode, FilterNode)):
+                saved_lists_of_children.append((node.parent,
+                                                node.parent.children))
+                node.parent.children = [node]
+                node = node.parent
+            self.update_new_node_with_matches_from_above(node)
+            for parent, saved_list_of_children in saved_lists_of_children:
+                parent.children = saved_list_of_children
 
     def delete_alpha_memory(self, amem: AlphaMemory):
+        """
+        Deletes an alpha memory that is no longer used, and the value index it
+        was filled from if no other memory uses it.
+        """
         del self.alpha_hash[amem.key]
+        if amem.value_index is not None:
+            amem.value_index.reference_count -= 1
+            if not amem.value_index.reference_count:
+                del self.value_indexes[amem.key[1]]
+        if amem.key[0] == '#fact#':
+            self.fact_index.remove(FactCond(*amem.key[1:]), amem)
+        else:
+            self.alpha_index.remove(amem.key, amem)
 
     def delete_node_and_any_unused_ancestors(self, node: ReteNode):
-        if isinstance(node, NccNode):
-            self.delete_node_and_any_unused_ancestors(node.partner)
-
+        """
+        Deletes a node and then its ancestors that are left without children.
+        The partner of an ncc node (and the partner's unused ancestors, i.e.,
+        the subnetwork) is deleted before the ncc node. The nodes are deleted
+        from an explicit stack, rather than recursively, so long chains of
+        nodes do not hit the recursion limit.
+        """
+        stack = [(node, False)]
+        while stack:
+            node, partner_deleted = stack.pop()
+            if isinstance(node, NccNode) and not partner_deleted:
+                stack.append((node, True))
+                stack.append((node.partner, False))
+                continue
+            unused_parent = self.delete_node(node)
+            if unused_parent is not None:
+                stack.append((unused_parent, False))
+
+    def delete_node(self, node: ReteNode) -> Optional[ReteNode]:
+        """
+        Deletes a node (and its tokens) and returns its parent if the parent
+        is left without children.
+        """
         if isinstance(node, BetaMemory):
             while node.items:
                 node.items[0].delete_token_and_descendents()
 
         if isinstance(node, NccPartnerNode):
             while node.new_result_buffer:
-                node.new_result_buffer[0].delete_token_and_descendents()
+                results = next(iter(node.new_result_buffer.values()))
+                results[0].delete_token_and_descendents()
 
         if isinstance(node, JoinNode) and not isinstance(node, NegativeNode):
             if not node.right_unlinked:
@@ -527,9 +1257,24 @@ class ReteNetwork:
             node.parent.all_children.remove(node)
 
             if not node.parent.all_children:
-                self.delete_node_and_any_unused_ancestors(node.parent)
+                return node.parent
 
         elif node.parent:
+            if isinstance(node, NegativeNode):
+                if node in node.amem.successors:
+                    node.amem.successors.remove(node)
+
+                node.amem.reference_count -= 1
+
+                if node.amem.reference_count == 0:
+                    self.delete_alpha_memory(node.amem)
+
             node.parent.children.remove(node)
-            if not node.parent.children:
-                self.delete_node_and_any_unused_ancestors(node.parent)
+            if isinstance(node.parent, MemoryJoinNode):
+                node.parent.all_children.remove(node)
+                unused = not node.parent.all_children
+            else:
+                unused = not node.parent.children
+            if unused:
+                return node.parent
+        return None
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import inspect
+
+from py_rete.common import V
+from py_rete.common import arg_accessors
+from py_rete.conditions import Cond
+from py_rete.conditions import Neg
+from py_rete.conditions import Ncc
+from py_rete.conditions import Exists
+from py_rete.conditions import Aggregate
+from py_rete.conditions import Filter
+from py_rete.conditions import Bind
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Any
+    from typing import Callable
+    from typing import Iterable
+    from typing import List
+    from typing import Set
+
+
+def is_join(cond: Any) -> bool:
+    """
+    Returns whether the condition is a positive condition (a join).
+    """
+    return isinstance(cond, Cond) and not isinstance(cond, Neg)
+
+
+def function_variables(func: Callable) -> Set[V]:
+    """
+    The variables that a Filter or Bind function takes as arguments.
+    """
+    return {v for _, v in arg_accessors(inspect.getfullargspec(func)[0])
+            if v is not None}
+
+
+def condition_variables(cond: Any) -> Set[V]:
+    """
+    Returns all of the variables that a condition mentions, including the
+    ones that are only bound inside of it (e.g., in an Ncc).
+    """
+    if isinstance(cond, Cond):
+        return {v for _, v in cond.vars}
+    if isinstance(cond, Filter):
+        return function_variables(cond.func)
+    if isinstance(cond, Bind):
+        return function_variables(cond.func) | {cond.to}
+    variables: Set[V] = set()
+    for inner in cond:
+        variables |= condition_variables(inner)
+    if isinstance(cond, Aggregate):
+        variables |= set(cond.group_by) | {cond.to}
+    return variables
+
+
+def bound_variables(cond: Any) -> Set[V]:
+    """
+    Returns the variables that a condition binds (if they are not bound
+    before it) for the conditions after it. Negations, exists, and filters
+    only test the matches and do not bind any.
+    """
+    if is_join(cond):
+        return condition_variables(cond)
+    if isinstance(cond, Bind):
+        return {cond.to}
+    if isinstance(cond, Aggregate):
+        return set(cond.group_by) | {cond.to}
+    return set()
+
+
+def required_variables(cond: Any) -> Set[V]:
+    """
+    Returns the variables that must be bound before a Filter or Bind can be
+    placed (the arguments of its function). A join that binds one of them or
+    only tests it again can be placed on either side of the Filter or Bind.
+    """
+    if isinstance(cond, (Filter, Bind)):
+        return function_variables(cond.func)
+    return set()
+
+
+def must_precede(first: Any, second: Any) -> bool:
+    """
+    Returns whether a condition that comes before another one must stay
+    before it. This is the case when they share a variable, unless both are
+    joins (which commute), both only test the matches, or one is a join and
+    the other a Filter or Bind (which is placed once its variables are bound,
+    see required_variables). Otherwise, moving one of them past the other
+    could change whether a variable is bound when it is tested or bound
+    inside a negation.
+    """
+    if is_join(first) and is_join(second):
+        return False
+    if ((is_join(first) and isinstance(second, (Filter, Bind))) or
+            (isinstance(first, (Filter, Bind)) and is_join(second))):
+        return False
+    if not bound_variables(first) and not bound_variables(second):
+        return False
+    return bool(condition_variables(first) & condition_variables(second))
+
+
+def order_conditions(conds: List[Any],
+                     cost: Callable[[Any, Set[V]], float],
+                     bound: Iterable[V] = ()) -> List[Any]:
+    """
+    Greedily reorders a list of conditions (see Production.get_rete_conds)
+    so that the intermediate matches stay small. Each condition stays after
+    the ones it must follow (see must_precede), a Filter or Bind also waits
+    until its variables are bound, and of the conditions that can come next:
+
+        - the ones that are not joins (negations, filters, binds, etc.) are
+          placed first, as early as their variables allow;
+        - otherwise, the join that shares a variable with the ones placed so
+          far (to avoid cross products) and has the lowest cost is placed.
+
+    The cost is the estimated number of matches of a join per match of the
+    conditions before it, given the variables bound by then. Ties keep the
+    original order. The bound variables are those bound above the conditions
+    (e.g., for the conditions of an Ncc), the conditions of an Ncc or Exists
+    are reordered as well.
+    """
+    bound = set(bound)
+    preceding = [{j for j in range(i) if must_precede(conds[j], conds[i])}
+                 for i in range(len(conds))]
+    placed: Set[int] = set()
+    ordered = []
+    while len(ordered) < len(conds):
+        ready = [i for i in range(len(conds))
+                 if i not in placed and preceding[i] <= placed]
+        bound_ready = [i for i in ready
+                       if required_variables(conds[i]) <= bound]
+        # A variable that no condition binds leaves its Filter or Bind in
+        # its original order.
+        ready = bound_ready or ready[:1]
+        tests = [i for i in ready if not is_join(conds[i])]
+        if tests:
+            best = tests[0]
+        else:
+            best = min(ready, key=lambda i: (
+                bool(bound) and not condition_variables(conds[i]) & bound,
+                cost(conds[i], bound), i))
+        placed.add(best)
+        cond = conds[best]
+        if isinstance(cond, (Ncc, Exists)):
+            cond = type(cond)(*order_conditions(list(cond), cost, bound))
+        ordered.append(cond)
+        bound |= bound_variables(cond)
+    return ordered
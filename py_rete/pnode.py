@@ -2,39 +2,94 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from py_rete.common import Token
+from py_rete.common import Match
+from py_rete.common import OrderedSet
 from py_rete.production import Production
 from py_rete.beta import BetaMemory
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing import List
-    from typing import Dict
     from typing import Any
+    from typing import Optional
+    from typing import Iterator
+    from typing import Set
+    from typing import Tuple
+    from py_rete.agenda import Agenda
     from py_rete.common import WME
-    from py_rete.common import V
 
 
 class PNode(BetaMemory):
     """
-    A beta network node that stores the matches for productions.
+    A beta network node that stores the matches for productions. If it has an
+    agenda, then the matches are also added to (and removed from) it.
+
+    The tokens that have been fired are kept in fired and are removed from the
+    agenda (refraction) until they are retracted.
+
+    The new tokens (the ones that have not been taken with pop_new_token,
+    new_activations, or get_new_match) are kept in order in new, with their
+    membership in new_members. Retracted tokens are only removed from
+    new_members and are skipped (and occasionally compacted away) when new is
+    read, so a retraction does not have to search or rebuild new.
     """
 
-    def __init__(self, production: Production, **kwargs):
+    def __init__(self, production: Production,
+                 agenda: Optional[Agenda] = None, **kwargs):
         super(PNode, self).__init__(**kwargs)
         self.production = production
+        self.agenda = agenda
         self.new: List[Token] = []
+        self.new_members: Set[Token] = set()
+        self.fired: OrderedSet = OrderedSet()
 
-    def left_activation(self, token: Token, wme: WME, binding: Dict[V, Any]):
-        new_token = Token(token, wme, node=self, binding=binding)
+    def left_activation(self, token: Token, wme: WME,
+                        values: Tuple[Any, ...]):
+        new_token = Token(token, wme, node=self, values=values)
         self.items.append(new_token)
         self.new.append(new_token)
+        self.new_members.add(new_token)
+        if self.agenda is not None:
+            self.agenda.add(Match(self, new_token))
 
-    def pop_new_token(self):
-        if self.new:
-            return self.new.pop()
+    def refract(self, token: Token) -> None:
+        """
+        Marks the token as fired and removes it from the agenda.
+        """
+        self.fired.append(token)
+        if self.agenda is not None:
+            self.agenda.remove(token)
 
-    def new_activations(self):
+    def remove_new(self, token: Token) -> None:
+        """
+        Removes a token from the new tokens, if it is one.
+        """
+        if token in self.new_members:
+            self.new_members.remove(token)
+            if len(self.new) > 2 * len(self.new_members) + 32:
+                self.new = [t for t in self.new if t in self.new_members]
+
+    @property
+    def new_tokens(self) -> Iterator[Token]:
+        """
+        The new tokens, in the order they were added.
+        """
+        for t in self.new:
+            if t in self.new_members:
+                yield t
+
+    def pop_new_token(self) -> Optional[Token]:
         while self.new:
             t = self.new.pop()
+            if t in self.new_members:
+                self.new_members.remove(t)
+                return t
+        return None
+
+    def new_activations(self):
+        while True:
+            t = self.pop_new_token()
+            if t is None:
+                return
             yield t
 
     @property
@@ -9,20 +9,28 @@ from py_rete.conditions import ConditionalElement
 from py_rete.conditions import Cond
 from py_rete.conditions import Ncc
 from py_rete.conditions import Neg
+from py_rete.conditions import FactCond
+from py_rete.conditions import FactNeg
 from py_rete.conditions import NOT
+from py_rete.conditions import EXISTS
+from py_rete.conditions import Exists
+from py_rete.conditions import Aggregate
 from py_rete.conditions import Filter
 from py_rete.conditions import Bind
 from py_rete.conditions import AND
 from py_rete.conditions import OR
 from py_rete.fact import Fact
-from py_rete.common import V
 from py_rete.common import Token
+from py_rete.common import arg_accessors
+from py_rete.common import resolve_args
 
 if TYPE_CHECKING:  # pragma: no cover
     from typing import Optional
     from typing import Callable
     from typing import List
+    from typing import Tuple
     from typing import Union
+    from py_rete.common import V
     from py_rete.pnode import PNode
 
 
@@ -44,19 +52,43 @@ def compile_disjuncts(it, nest: bool = True):
             inner = compile_disjuncts(it[0])
         return (tuple(NOT(*branch) if isinstance(branch, tuple) else
                       NOT(branch) for branch in inner),)
+    elif isinstance(it, (EXISTS, Aggregate)):
+        if len(it) > 1:
+            inner = compile_disjuncts(AND(*[ele for ele in it]))
+        else:
+            inner = compile_disjuncts(it[0])
+        if len(inner) > 1:
+            raise ValueError("{} does not support disjunctions (OR).".format(
+                type(it).__name__))
+        branch = inner[0]
+        if (isinstance(branch, ConditionalList) or
+                not isinstance(branch, tuple)):
+            branch = (branch,)
+        if isinstance(it, Aggregate):
+            return (it.with_conditions(*branch),)
+        return (EXISTS(*branch),)
     elif nest:
         return (it,)
     else:
         return it
 
 
-def get_rete_conds(it):
+def get_rete_conds(it, whole_facts: bool = False):
+    """
+    Compiles a conjunct into the list of conditions used to build the rete
+    network. If whole_facts is True, then each Fact becomes a single FactCond
+    instead of one Cond per slot.
+    """
     for ele in it:
         if isinstance(ele, (Cond, Bind, Filter)):
             yield ele
         elif isinstance(ele, NOT):
-            subcond = list(get_rete_conds(ele))
-            if len(subcond) == 1 and isinstance(subcond[0], Cond):
+            subcond = list(get_rete_conds(ele, whole_facts))
+            if len(subcond) == 1 and isinstance(subcond[0], FactCond):
+                yield FactNeg(subcond[0].identifier,
+                              subcond[0].attribute,
+                              subcond[0].value)
+            elif len(subcond) == 1 and isinstance(subcond[0], Cond):
                 yield Neg(subcond[0].identifier,
                           subcond[0].attribute,
                           subcond[0].value)
@@ -66,6 +98,12 @@ def get_rete_conds(it):
                 # print(subcond)
                 yield Ncc(*subcond)
 
+        elif isinstance(ele, EXISTS):
+            yield Exists(*get_rete_conds(ele, whole_facts))
+
+        elif isinstance(ele, Aggregate):
+            yield ele.with_conditions(*get_rete_conds(ele, whole_facts))
+
         elif isinstance(ele, Fact):
             copy = ele.duplicate()
             copy.id = ele.id
@@ -73,7 +111,7 @@ def get_rete_conds(it):
 
             for k in copy:
                 if isinstance(copy[k], Fact):
-                    for cond in get_rete_conds([copy[k]]):
+                    for cond in get_rete_conds([copy[k]], whole_facts):
                         yield cond
 
                     if copy[k].id is None:
@@ -81,11 +119,14 @@ def get_rete_conds(it):
                     else:
                         copy[k] = copy[k].id
 
-            for cond in copy.conds:
-                yield cond
+            if whole_facts:
+                yield copy.fact_cond
+            else:
+                for cond in copy.conds:
+                    yield cond
 
         elif isinstance(ele, AND):
-            for cond in get_rete_conds(ele):
+            for cond in get_rete_conds(ele, whole_facts):
                 yield cond
 
 
@@ -93,13 +134,24 @@ class Production():
     """
     A production rule in py_rete. It is comprised of conditions and a function
     to execute once all conditions are bound.
+
+    The salience sets the priority of the production's matches, matches with
+    a higher salience are fired first. It is either a number or a function
+    that computes the salience of a match from its bindings (its arguments are
+    bound like the arguments of a Filter).
     """
     conditions: Union[ConditionalElement, ConditionalList]
 
     def __init__(self, pattern: Optional[Union[ConditionalElement,
-                                               ConditionalList]] = None):
+                                               ConditionalList]] = None,
+                 salience: Union[float, Callable] = 0):
         self.__wrapped__: Optional[Callable] = None
         self._wrapped_args: List[str] = []
+        self._arg_accessors: List[Tuple[str, Optional[V]]] = []
+        self.salience = salience
+        self._salience_accessors: Optional[List[Tuple[str, Optional[V]]]] = (
+            arg_accessors(inspect.getfullargspec(salience)[0])
+            if callable(salience) else None)
         self._rete_net = None
         self.pattern: Optional[Union[ConditionalElement,
                                      ConditionalList]] = pattern
@@ -113,20 +165,29 @@ class Production():
             for token in node.activations:
                 yield token
 
-    def get_rete_conds(self):
+    def get_rete_conds(self, whole_facts: bool = False):
         if self.pattern is None:
             return ([],)
         disjuncts = compile_disjuncts(self.pattern)
-        return [list(get_rete_conds(AND(*disjunct)))
-                if isinstance(disjunct, tuple) else
-                list(get_rete_conds(AND(disjunct))) for disjunct in disjuncts]
+        return [list(get_rete_conds(AND(*disjunct), whole_facts))
+                if isinstance(disjunct, tuple) and
+                not isinstance(disjunct, ConditionalList) else
+                list(get_rete_conds(AND(disjunct), whole_facts))
+                for disjunct in disjuncts]
+
+    def get_salience(self, token: Token) -> float:
+        """
+        Returns the salience of the match for the token.
+        """
+        if self._salience_accessors is None:
+            return self.salience
+        return self.salience(**resolve_args(self._salience_accessors,
+                                            token.values, token.slots,
+                                            self._rete_net))
 
     def fire(self, token: Token):
-        kwargs = {arg: self._rete_net if arg == 'net' else
-                  self._rete_net.facts[token.binding[V(arg)]] if
-                  token.binding[V(arg)] in self._rete_net.facts else
-                  token.binding[V(arg)] for arg in self._wrapped_args}
-        return self(**kwargs)
+        return self(**resolve_args(self._arg_accessors, token.values,
+                                   token.slots, self._rete_net))
 
     def __call__(self, *args, **kwargs):
         if self.__wrapped__ is None:
@@ -139,6 +200,7 @@ class Production():
                 if not any(p.kind == inspect.Parameter.VAR_KEYWORD
                            for p in signature.parameters.values()):
                     self._wrapped_args = set(signature.parameters.keys())
+                    self._arg_accessors = arg_accessors(self._wrapped_args)
                 return update_wrapper(self, func)
 
         else:
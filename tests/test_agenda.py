@@ -0,0 +1,179 @@
+from py_rete.common import WME
+from py_rete.common import V
+from py_rete.conditions import AND
+from py_rete.conditions import Cond
+from py_rete.network import ReteNetwork
+from py_rete.production import Production
+import pytest
+
+
+def make_net(strategy):
+    net = ReteNetwork(strategy=strategy)
+
+    @Production(Cond(V('x'), 'is', V('y')))
+    def single():
+        pass
+
+    @Production(AND(Cond(V('x'), 'is', V('y')),
+                    Cond(V('y'), 'is', V('z'))))
+    def double():
+        pass
+
+    net.add_production(single)
+    net.add_production(double)
+    return net
+
+
+def selected(net):
+    match = net.agenda.select()
+    return (match.pnode.production.__name__,
+            tuple(sorted(v.name + '=' + val
+                         for v, val in match.token.binding.items())))
+
+
+def test_agenda_tracks_matches():
+    net = make_net('depth')
+    wmes = [WME('a', 'is', 'b'), WME('b', 'is', 'c'), WME('c', 'is', 'd')]
+    for wme in wmes:
+        net.add_wme(wme)
+    assert len(net.agenda) == len(list(net.matches)) == 5
+
+    net.remove_wme(wmes[1])
+    assert len(net.agenda) == len(list(net.matches)) == 2
+    assert (set(m.token for m in net.agenda) ==
+            set(m.token for m in net.matches))
+
+
+@pytest.mark.parametrize('strategy,first', [
+    ('depth', ('single', ('x=c', 'y=d'))),
+    ('breadth', ('single', ('x=a', 'y=b'))),
+    ('lex', ('double', ('x=b', 'y=c', 'z=d'))),
+    ('mea', ('single', ('x=c', 'y=d'))),
+])
+def test_agenda_strategies(strategy, first):
+    net = make_net(strategy)
+    for wme in [WME('a', 'is', 'b'), WME('b', 'is', 'c'),
+                WME('c', 'is', 'd')]:
+        net.add_wme(wme)
+    assert selected(net) == first
+
+
+def test_run_random_and_unknown_strategy():
+    net = make_net('random')
+    net.add_wme(WME('a', 'is', 'b'))
+    assert selected(net) == ('single', ('x=a', 'y=b'))
+    net.run(3)
+
+    with pytest.raises(ValueError):
+        ReteNetwork(strategy='fifo')
+
+
+@pytest.mark.parametrize('strategy', ['random', 'depth', 'lex'])
+def test_salience(strategy):
+    net = ReteNetwork(strategy=strategy)
+    fired = []
+
+    @Production(Cond(V('x'), 'is', V('y')), salience=10)
+    def high(x):
+        fired.append(('high', x))
+
+    @Production(Cond(V('x'), 'is', V('y')))
+    def low(x):
+        fired.append(('low', x))
+
+    @Production(Cond(V('x'), 'rank', V('r')), salience=lambda r: r)
+    def ranked(x):
+        fired.append(('ranked', x))
+
+    for p in [low, high, ranked]:
+        net.add_production(p)
+
+    net.add_wme(WME('a', 'is', 'b'))
+    net.add_wme(WME('c', 'rank', 5))
+    net.add_wme(WME('d', 'rank', 20))
+
+    assert net.agenda.select().pnode.production is ranked
+    assert net.agenda.select().token.binding[V('x')] == 'd'
+
+    match = net.get_new_match()
+    assert match.pnode.production is ranked
+    assert match.token.binding[V('x')] == 'd'
+    assert net.get_new_match().pnode.production is high
+    assert net.get_new_match().token.binding[V('x')] == 'c'
+    assert net.get_new_match().pnode.production is low
+    assert net.get_new_match() is None
+
+    net.remove_wme(WME('d', 'rank', 20))
+    net.run(1)
+    assert fired == [('high', 'a')]
+
+
+def test_refraction_and_quiescence():
+    net = ReteNetwork(strategy='depth')
+    fired = []
+
+    @Production(Cond(V('x'), 'is', V('y')))
+    def noop(x):
+        fired.append(x)
+
+    net.add_production(noop)
+    net.add_wme(WME('a', 'is', 'b'))
+    net.add_wme(WME('c', 'is', 'd'))
+
+    net.run(10)
+    assert fired == ['c', 'a']
+    assert len(net.agenda) == 0
+    assert len(list(net.matches)) == 2
+
+    net.run(None)
+    assert fired == ['c', 'a']
+
+    net.remove_wme(WME('a', 'is', 'b'))
+    assert len(noop.p_nodes[0].fired) == 1
+    net.add_wme(WME('a', 'is', 'b'))
+    net.run(None)
+    assert fired == ['c', 'a', 'a']
+
+
+def test_new_matches_after_retraction():
+    net = ReteNetwork()
+
+    @Production(Cond(V('x'), 'is', V('y')))
+    def single():
+        pass
+
+    net.add_production(single)
+    wmes = [WME('a{}'.format(i), 'is', 'b') for i in range(100)]
+    for w in wmes:
+        net.add_wme(w)
+    for w in wmes[:90]:
+        net.remove_wme(w)
+
+    pnode = single.p_nodes[0]
+    assert len(pnode.new) < 100
+    assert [m.token.wme for m in net.new_matches] == wmes[90:]
+    assert net.get_new_match().token.wme == wmes[-1]
+    assert pnode.pop_new_token().wme == wmes[-2]
+    assert len(list(pnode.new_activations())) == 8
+    assert list(net.new_matches) == []
+
+
+def test_random_agenda_salience_heap():
+    net = ReteNetwork(strategy='random')
+
+    @Production(Cond(V('x'), 'rank', V('r')), salience=lambda r: r)
+    def ranked(x):
+        pass
+
+    net.add_production(ranked)
+    for r in range(200):
+        net.add_wme(WME('a{}'.format(r), 'rank', r))
+    for r in range(199, 0, -1):
+        assert net.agenda.select().token.binding[V('r')] == r
+        net.remove_wme(WME('a{}'.format(r), 'rank', r))
+    assert len(net.agenda.saliences) <= 2 * len(net.agenda.matches) + 32
+
+    net.add_wme(WME('b', 'rank', -1))
+    net.add_wme(WME('c', 'rank', 0))
+    assert sorted(net.agenda.matches) == [-1, 0]
+    assert net.agenda.select().token.binding[V('r')] == 0
@@ -1,6 +1,13 @@
 from py_rete.common import WME
 from py_rete.network import ReteNetwork
 from py_rete.conditions import Cond
+from py_rete.conditions import BETWEEN
+from py_rete.conditions import GE
+from py_rete.conditions import GT
+from py_rete.conditions import IN
+from py_rete.conditions import LE
+from py_rete.conditions import LT
+from py_rete.fact import Fact
 from py_rete.production import Production
 from py_rete.common import V
 import pytest
@@ -51,3 +58,145 @@ def test_intra_condition_consistency():
     net.add_production(test2)
 
     assert len(list(net.matches)) == 1
+
+
+def test_alpha_index_dispatch():
+    net = ReteNetwork()
+
+    am_attr = net.build_or_share_alpha_memory(Cond(V('x'), 'color', V('y')))
+    am_value = net.build_or_share_alpha_memory(Cond(V('x'), 'color', 'red'))
+    am_both = net.build_or_share_alpha_memory(Cond('B1', 'color', 'red'))
+    am_any = net.build_or_share_alpha_memory(Cond(V('x'), V('a'), V('y')))
+
+    wme = WME('B1', 'color', 'red')
+    assert set(net.alpha_index.matching_memories(wme)) == {
+        am_attr, am_value, am_both, am_any}
+
+    wme = WME('B2', 'color', 'blue')
+    assert set(net.alpha_index.matching_memories(wme)) == {am_attr, am_any}
+
+    wme = WME('B2', 'on', 'table')
+    assert set(net.alpha_index.matching_memories(wme)) == {am_any}
+
+    net.delete_alpha_memory(am_any)
+    net.delete_alpha_memory(am_both)
+    assert net.alpha_index.any_attribute is None
+    assert set(net.alpha_index.matching_memories(
+        WME('B1', 'color', 'red'))) == {am_attr, am_value}
+
+    net.delete_alpha_memory(am_attr)
+    net.delete_alpha_memory(am_value)
+    assert not net.alpha_index.attributes
+
+
+def test_predicate_alpha_memories():
+    net = ReteNetwork()
+    for i, load in enumerate([5, 150, 90, 300, 'high', 100]):
+        net.add_wme(WME('h{}'.format(i), 'load', load))
+
+    am = net.build_or_share_alpha_memory(Cond(V('h'), 'load', GT(100)))
+    assert 'load' in net.value_indexes
+    assert sorted(w.value for w in am.items) == [150, 300]
+    same = net.build_or_share_alpha_memory(Cond(V('x'), 'load', GT(100)))
+    assert am is same
+
+    between = net.build_or_share_alpha_memory(
+        Cond(V('h'), 'load', BETWEEN(90, 150)))
+    assert sorted(w.value for w in between.items) == [90, 100, 150]
+    members = net.build_or_share_alpha_memory(
+        Cond(V('h'), 'load', IN('high', 5, 7)))
+    assert sorted(str(w.value) for w in members.items) == ['5', 'high']
+    at_most = net.build_or_share_alpha_memory(Cond(V('h'), 'load', LE(90)))
+    assert sorted(w.value for w in at_most.items) == [5, 90]
+
+    net.add_wme(WME('h6', 'load', 120))
+    net.add_wme(WME('h7', 'load', 'low'))
+    net.remove_wme(WME('h3', 'load', 300))
+    assert sorted(w.value for w in am.items) == [120, 150]
+    assert sorted(w.value for w in between.items) == [90, 100, 120, 150]
+    numbers = net.value_indexes['load'].sorted['number']
+    assert numbers == [5, 90, 100, 120, 150]
+
+    below = net.build_or_share_alpha_memory(Cond(V('h'), 'load', LT(100)))
+    assert sorted(w.value for w in below.items) == [5, 90]
+
+
+@pytest.mark.parametrize('reorder', [False, True])
+def test_mixed_kind_bounds(reorder):
+    # No value can be compared with both bounds, so nothing matches (as in
+    # BETWEEN.test) instead of the index raising a TypeError.
+    net = ReteNetwork(reorder=reorder)
+    for load in [1, 2, 'a', 'x', 'y']:
+        net.add_wme(WME('h', 'load', load))
+
+    @Production(Cond(V('h'), 'load', BETWEEN('x', 2)) |
+                Cond(V('h'), 'load', BETWEEN(1, 'x')))
+    def mixed():
+        pass
+
+    @Production(Cond(V('h'), 'load', BETWEEN('a', 'x')))
+    def strings():
+        pass
+
+    net.add_production(mixed)
+    net.add_production(strings)
+    assert len(list(mixed.activations)) == 0
+    assert len(list(strings.activations)) == 2
+    net.add_wme(WME('h', 'load', 1.5))
+    assert len(list(mixed.activations)) == 0
+
+
+def test_value_index_dropped_with_productions():
+    net = ReteNetwork()
+    for load in [5, 150]:
+        net.add_wme(WME('h{}'.format(load), 'load', load))
+
+    @Production(Cond(V('h'), 'load', GT(100)))
+    def high():
+        pass
+
+    @Production(Cond(V('h'), 'load', LT(100)) & Cond(V('h'), 'load', GT(1)))
+    def low():
+        pass
+
+    net.add_production(high)
+    net.add_production(low)
+    assert net.value_indexes['load'].reference_count == 3
+    net.remove_production(high)
+    assert net.value_indexes['load'].reference_count == 2
+    net.add_wme(WME('h7', 'load', 7))
+    assert sorted(t.binding[V('h')] for t in low.activations) == ['h5', 'h7']
+
+    net.remove_production(low)
+    assert not net.value_indexes
+    net.add_wme(WME('h9', 'load', 9))
+    assert not net.value_indexes
+
+    # Adding the production again rebuilds the index, with the wmes added
+    # while there was none.
+    net.add_production(low)
+    assert net.value_indexes['load'].reference_count == 2
+    assert net.value_indexes['load'].sorted['number'] == [5, 7, 9, 150]
+    assert sorted(t.binding[V('h')] for t in low.activations) == [
+        'h5', 'h7', 'h9']
+    net.remove_wme(WME('h7', 'load', 7))
+    assert net.value_indexes['load'].sorted['number'] == [5, 9, 150]
+
+
+def test_predicate_facts():
+    for whole_facts in [False, True]:
+        net = ReteNetwork(whole_facts=whole_facts)
+
+        @Production(Fact(host=V('h'), load=GE(100)))
+        def overloaded():
+            pass
+
+        small = Fact(host='a', load=10)
+        net.add_fact(small)
+        net.add_fact(Fact(host='b', load=100))
+        net.add_production(overloaded)
+        assert [t.binding[V('h')] for t in overloaded.activations] == ['b']
+
+        small['load'] = 200
+        net.update_fact(small)
+        assert len(list(overloaded.activations)) == 2
@@ -3,6 +3,7 @@ from py_rete.conditions import Cond
 from py_rete.conditions import Ncc
 from py_rete.common import WME
 from py_rete.common import Token
+from py_rete.common import OrderedSet
 from py_rete.common import V
 from py_rete.fact import Fact
 from py_rete.network import ReteNetwork
@@ -261,3 +262,36 @@ def test_add_remove_ncc():
 
     net.remove_production(ncc_fun)
     assert len(net.beta_root.children) == 0
+
+
+def test_ordered_set():
+    items = OrderedSet(['a', 'b', 'c'])
+    items.append('d')
+    items.remove('b')
+
+    assert items == ['a', 'c', 'd']
+    assert list(reversed(items)) == ['d', 'c', 'a']
+    assert items[0] == 'a'
+    assert items[-1] == 'd'
+    assert items[1] == 'c'
+    assert 'c' in items
+    assert 'b' not in items
+    assert items.pop() == 'd'
+    assert len(items) == 2
+
+
+def test_readd_removed_wme():
+    net = ReteNetwork()
+
+    @Production(Cond(V('x'), 'on', V('y')))
+    def on():
+        pass
+
+    net.add_production(on)
+
+    wme = WME('a', 'on', 'b')
+    for i in range(3):
+        net.add_wme(wme)
+        assert len(list(net.matches)) == 1
+        net.remove_wme(wme)
+        assert len(list(net.matches)) == 0
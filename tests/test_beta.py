@@ -1,5 +1,8 @@
 from py_rete.production import Production
 from py_rete.conditions import AND
+from py_rete.conditions import NOT
+from py_rete.conditions import EXISTS
+from py_rete.conditions import Aggregate
 from py_rete.conditions import Cond
 from py_rete.conditions import Neg
 from py_rete.conditions import Ncc
@@ -10,6 +13,11 @@ from py_rete.common import WME
 from py_rete.common import Token
 from py_rete.common import V
 from py_rete.network import ReteNetwork
+from py_rete.join_node import JoinNode
+from py_rete.exists_node import ExistsNode
+from py_rete.exists_node import ConjunctiveExistsNode
+from py_rete.aggregate_node import AggregateNode
+import pytest
 
 
 def test_network_case0():
@@ -361,3 +369,581 @@ def test_black_white():
 
     assert len(list(p0.activations)) == 1
     assert list(p0.activations)[0].binding[V('item')] == 'item:1'
+
+
+def test_join_uses_alpha_index():
+    net = ReteNetwork()
+    c0 = Cond(V('x'), 'on', V('y'))
+    c1 = Cond(V('y'), 'color', V('c'))
+
+    @Production(AND(c0, c1))
+    def p0():
+        pass
+    net.add_production(p0)
+
+    am1 = net.build_or_share_alpha_memory(c1)
+    match_c0 = net.beta_root.children[0].all_children[0].children[0]
+    join = match_c0.all_children[0]
+    assert join.index == (V('y'), 'identifier')
+    assert 'identifier' in am1.indexes
+
+    for i in range(10):
+        net.add_wme(WME('B{}'.format(i), 'color', 'red'))
+    assert len(am1.indexes['identifier']) == 10
+
+    net.add_wme(WME('B0', 'on', 'B3'))
+    assert len(list(p0.activations)) == 1
+    assert list(p0.activations)[0].binding[V('c')] == 'red'
+
+    net.remove_wme(WME('B3', 'color', 'red'))
+    assert 'B3' not in am1.indexes['identifier']
+    assert len(list(p0.activations)) == 0
+
+
+def test_compiled_join_matches_interpreted():
+    wmes = [WME('B1', 'on', 'B2'), WME('B2', 'left-of', 'B3'),
+            WME('B3', 'color', 'red'), WME('B2', 'on', 'B2')]
+    results = []
+    for compiled in [True, False]:
+        JoinNode.compiled = compiled
+        try:
+            net = ReteNetwork()
+
+            @Production(AND(Cond(V('x'), 'on', V('y')),
+                            Cond(V('y'), 'left-of', V('z')),
+                            Neg(V('y'), 'color', 'red'),
+                            Cond(V('z'), 'color', V('c'))))
+            def p0():
+                pass
+
+            @Production(Cond(V('x'), 'on', V('x')))
+            def p1():
+                pass
+
+            net.add_production(p0)
+            net.add_production(p1)
+            for wme in wmes:
+                net.add_wme(wme)
+
+            join = p1.p_nodes[0].parent
+            assert ('perform_join_test' in vars(join)) == compiled
+            results.append(sorted(str(sorted(m.token.binding.items(),
+                                             key=str))
+                                  for m in net.matches))
+        finally:
+            JoinNode.compiled = True
+
+    assert results[0] == results[1]
+    assert len(results[0]) == 4
+
+
+def test_token_slots():
+    net = ReteNetwork()
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Cond(V('y'), 'on', 'table'),
+                    Bind(lambda x, y: x + y, V('xy')),
+                    Cond(V('y'), 'color', V('c'))))
+    def p0(xy, c):
+        return xy, c
+
+    net.add_production(p0)
+    for wme in [WME('B1', 'on', 'B2'), WME('B2', 'on', 'table'),
+                WME('B2', 'color', 'red')]:
+        net.add_wme(wme)
+
+    pnode = p0.p_nodes[0]
+    assert pnode.slots == {V('x'): 0, V('y'): 1, V('xy'): 2, V('c'): 3}
+    token = list(pnode.activations)[0]
+    assert token.values == ('B1', 'B2', 'B1B2', 'red')
+    assert token.binding == {V('x'): 'B1', V('y'): 'B2', V('xy'): 'B1B2',
+                             V('c'): 'red'}
+    assert list(net.matches)[0].fire() == ('B1B2', 'red')
+
+    # A join that binds no new variables shares its parent's slots.
+    join = token.parent.node.parent.parent
+    assert isinstance(join, JoinNode)
+    assert join.slots is join.parent.slots
+
+
+def test_add_wmes_batch():
+    wmes = [WME('B1', 'on', 'B2'), WME('B2', 'on', 'B3'),
+            WME('B3', 'on', 'B1'), WME('B2', 'color', 'red'),
+            WME('B3', 'color', 'red'), WME('B1', 'on', 'B2')]
+    results = []
+    for batch in [False, True]:
+        net = ReteNetwork()
+
+        @Production(AND(Cond(V('x'), 'on', V('y')),
+                        Cond(V('y'), 'on', V('z')),
+                        Neg(V('z'), 'color', 'red')))
+        def p0():
+            pass
+
+        net.add_production(p0)
+        if batch:
+            net.add_wmes(wmes)
+        else:
+            for wme in wmes:
+                net.add_wme(wme)
+
+        assert len(net.working_memory) == 5
+        results.append(sorted(str(sorted(t.binding.items(), key=str))
+                              for t in p0.activations))
+
+    assert results[0] == results[1]
+    assert len(results[0]) == 1
+
+
+def test_add_productions_backfill():
+    wmes = [WME('B1', 'on', 'B2'), WME('B2', 'on', 'B3'),
+            WME('B3', 'on', 'B1'), WME('B2', 'color', 'red'),
+            WME('B3', 'color', 'blue')]
+    results = []
+    for batch in [False, True]:
+        net = ReteNetwork()
+        for wme in wmes:
+            net.add_wme(wme)
+
+        @Production(AND(Cond(V('x'), 'on', V('y')),
+                        Cond(V('y'), 'on', V('z')),
+                        Neg(V('z'), 'color', 'red')))
+        def p0():
+            pass
+
+        @Production(AND(Cond(V('x'), 'on', V('y')),
+                        Cond(V('y'), 'color', V('c'))))
+        def p1():
+            pass
+
+        if batch:
+            net.add_productions([p0, p1])
+        else:
+            net.add_production(p0)
+            net.add_production(p1)
+
+        assert net.new_alpha_memories is None
+        results.append(sorted(str(sorted(m.token.binding.items(), key=str))
+                              for m in net.matches))
+
+    assert results[0] == results[1]
+    assert len(results[0]) == 4
+
+
+def test_negative_node_index_and_count():
+    net = ReteNetwork()
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Neg(V('y'), 'color', 'red')))
+    def p0():
+        pass
+
+    net.add_production(p0)
+    neg = p0.p_nodes[0].parent
+    assert neg.index == (V('y'), 'identifier')
+    assert 'identifier' in neg.amem.indexes
+
+    net.add_wme(WME('B1', 'on', 'B2'))
+    net.add_wme(WME('B1', 'on', 'B3'))
+    assert len(list(p0.activations)) == 2
+
+    net.add_wme(WME('B2', 'color', 'red'))
+    net.add_wme(WME('B4', 'color', 'red'))
+    assert [t.join_count for t in neg.items] == [1, 0]
+    assert [t.binding[V('y')] for t in p0.activations] == ['B3']
+
+    net.add_wme(WME('B1', 'on', 'B4'))
+    assert [t.join_count for t in neg.items] == [1, 0, 1]
+
+    net.remove_wme(WME('B4', 'color', 'red'))
+    assert sorted(t.binding[V('y')] for t in p0.activations) == ['B3', 'B4']
+    net.remove_wme(WME('B2', 'color', 'red'))
+    assert len(list(p0.activations)) == 3
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_negative_count_after_ncc_unblock(merge_memories):
+    # Removing the wme unblocks the ncc, which adds a token to the negative
+    # node below it that never counted the wme.
+    @Production(AND(Cond(V('x'), 'is', 'a'),
+                    NOT(AND(Cond(V('x'), 'q', V('y')),
+                            Cond(V('y'), 'r', 's'))),
+                    NOT(Cond(V('x'), 'q', V('z')))))
+    def p0():
+        pass
+
+    net = ReteNetwork(merge_memories=merge_memories)
+    net.add_production(p0)
+    for wme in [WME('a1', 'is', 'a'), WME('a1', 'q', 'b1'),
+                WME('b1', 'r', 's')]:
+        net.add_wme(wme)
+    net.remove_wme(WME('a1', 'q', 'b1'))
+    assert len(list(p0.activations)) == 1
+    assert p0.p_nodes[0].parent.items[0].join_count == 0
+
+    net.add_wme(WME('a1', 'q', 'c1'))
+    assert len(list(p0.activations)) == 0
+
+
+def test_ncc_owner_index_and_result_buffer():
+    net = ReteNetwork()
+    c0 = Cond(V('x'), 'on', V('y'))
+    c1 = Cond(V('y'), 'left-of', V('z'))
+    c2 = Cond(V('z'), 'color', 'red')
+    c3 = Cond(V('z'), 'on', V('w'))
+
+    @Production(c0 & c1 & ~(c2 & c3))
+    def p0():
+        pass
+
+    net.add_production(p0)
+    ncc = p0.p_nodes[0].parent
+    # Activate the subnetwork before the ncc node, so the partner has to
+    # buffer its results until their owner arrives.
+    ncc.parent.children.remove(ncc)
+    ncc.parent.children.append(ncc)
+
+    for wme in [WME('B1', 'on', 'B2'), WME('B1', 'on', 'B3'),
+                WME('B3', 'color', 'red'), WME('B3', 'on', 'table'),
+                WME('B2', 'left-of', 'B3'), WME('B3', 'left-of', 'B4')]:
+        net.add_wme(wme)
+
+    assert [t.binding[V('y')] for t in p0.activations] == ['B3']
+    assert not ncc.partner.new_result_buffer
+    assert len(ncc.owners) == 2
+    assert all(ncc.owners[(t.parent, t.wme)] is t for t in ncc.items)
+
+    net.remove_wme(WME('B3', 'on', 'table'))
+    assert len(list(p0.activations)) == 2
+    net.remove_wme(WME('B2', 'left-of', 'B3'))
+    assert len(ncc.owners) == 1
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_repeated_join_below_filter_and_bind(merge_memories):
+    # The joins on the same alpha memory are ordered through the bind and
+    # filter nodes between them, so a new wme is not matched by both.
+    @Production(AND(Cond(V('o'), 'b', V('x')),
+                    Bind(lambda x: x, V('k')),
+                    Cond(V('y'), 'a', V('o')),
+                    Filter(lambda y: True),
+                    Cond(V('y'), 'c', V('w')),
+                    Cond(V('o'), 'b', V('x')),
+                    NOT(AND(Cond(V('x'), 'a', V('o2')),
+                            Cond(V('o'), 'c', V('z'))))))
+    def p0():
+        pass
+
+    net = ReteNetwork(merge_memories=merge_memories)
+    net.add_production(p0)
+    for wme in [WME('O', 'b', 'X'), WME('Y', 'a', 'O'), WME('Y', 'c', 'W'),
+                WME('O', 'b', 'X2')]:
+        net.add_wme(wme)
+    ncc = p0.p_nodes[0].parent
+    assert len(ncc.items) == len(ncc.owners) == 2
+    assert sorted(t.binding[V('x')] for t in p0.activations) == ['X', 'X2']
+
+    net.remove_production(p0)
+    assert net.num_nodes() == 1
+
+
+def test_exists():
+    net = ReteNetwork()
+
+    @Production(Cond(V('x'), 'on', V('y')) &
+                EXISTS(Cond(V('y'), 'color', 'red')))
+    def p0():
+        pass
+
+    @Production(Cond(V('x'), 'on', V('y')) &
+                EXISTS(Cond(V('y'), 'left-of', V('z')) &
+                       Cond(V('z'), 'color', 'red')))
+    def p1():
+        pass
+
+    net.add_production(p0)
+    net.add_production(p1)
+    exists = p0.p_nodes[0].parent
+    assert isinstance(exists, ExistsNode)
+    assert isinstance(p1.p_nodes[0].parent, ConjunctiveExistsNode)
+
+    net.add_wme(WME('B1', 'on', 'B2'))
+    assert len(list(p0.activations)) == 0
+    net.add_wme(WME('B2', 'color', 'red'))
+    net.add_wme(WME('B2', 'color', 'blue'))
+    assert len(list(p0.activations)) == 1
+    assert list(p0.activations)[0].binding == {V('x'): 'B1', V('y'): 'B2'}
+
+    # Only the count changes for additional supporting wmes.
+    net.add_wme(WME('B2', 'left-of', 'B3'))
+    net.add_wme(WME('B2', 'left-of', 'B4'))
+    net.add_wme(WME('B3', 'color', 'red'))
+    net.add_wme(WME('B4', 'color', 'red'))
+    assert len(list(p1.activations)) == 1
+    assert list(p1.activations)[0].binding == {V('x'): 'B1', V('y'): 'B2'}
+    assert p1.p_nodes[0].parent.items[0].join_count == 2
+
+    net.remove_wme(WME('B3', 'color', 'red'))
+    assert len(list(p1.activations)) == 1
+    net.remove_wme(WME('B2', 'left-of', 'B4'))
+    assert len(list(p1.activations)) == 0
+
+    net.remove_wme(WME('B2', 'color', 'red'))
+    assert len(list(p0.activations)) == 0
+    assert exists.items[0].join_count == 0
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_exists_regains_support(merge_memories):
+    @Production(AND(Cond(V('x'), 'is', 'a'),
+                    NOT(AND(Cond(V('x'), 'q', V('y')),
+                            Cond(V('y'), 'r', 's'))),
+                    EXISTS(Cond(V('x'), 'q', V('z')))))
+    def p0():
+        pass
+
+    net = ReteNetwork(merge_memories=merge_memories)
+    net.add_production(p0)
+    for wme in [WME('a1', 'is', 'a'), WME('a1', 'q', 'b1'),
+                WME('b1', 'r', 's')]:
+        net.add_wme(wme)
+    net.remove_wme(WME('a1', 'q', 'b1'))
+    assert len(list(p0.activations)) == 0
+
+    net.add_wme(WME('a1', 'q', 'c1'))
+    assert len(list(p0.activations)) == 1
+    net.remove_wme(WME('a1', 'q', 'c1'))
+    assert len(list(p0.activations)) == 0
+    net.add_wme(WME('a1', 'q', 'c2'))
+    assert len(list(p0.activations)) == 1
+
+
+def test_exists_fact():
+    for whole_facts in [False, True]:
+        net = ReteNetwork(whole_facts=whole_facts)
+
+        @Production(Fact(host=V('h')) &
+                    EXISTS(Fact(alert_host=V('h'), status='open')))
+        def p0():
+            pass
+
+        net.add_production(p0)
+        net.add_fact(Fact(host='h1'))
+        alerts = [Fact(alert_host='h1', status='open') for i in range(3)]
+        for alert in alerts:
+            net.add_fact(alert)
+        assert len(list(p0.activations)) == 1
+
+        for alert in alerts[:2]:
+            net.remove_fact(alert)
+        assert len(list(p0.activations)) == 1
+        alerts[2]['status'] = 'closed'
+        net.update_fact(alerts[2])
+        assert len(list(p0.activations)) == 0
+
+
+def test_exists_added_late():
+    # The node is linked to its alpha memory once, even if it gets tokens
+    # from matches above when it is built.
+    net = ReteNetwork(whole_facts=True)
+    facts = [Fact(a=0), Fact(b=1, a=0), Fact(b=1)]
+    for f in facts:
+        net.add_fact(f)
+
+    @Production(Fact(a=V('x')) & EXISTS(Fact(b=V('x'))))
+    def p0():
+        pass
+
+    net.add_production(p0)
+    exists = p0.p_nodes[0].parent
+    assert isinstance(exists, ExistsNode)
+    assert exists.amem.successors.count(exists) == 1
+
+    net.add_fact(Fact(a=1))
+    net.remove_fact(facts[2])
+    assert [t.binding[V('x')] for t in p0.activations] == [1]
+
+
+def test_aggregate():
+    net = ReteNetwork()
+    totals = {}
+
+    @Production(Aggregate(Fact(host=V('h'), load=V('l')), sum='l',
+                          group_by='h', to=V('total')))
+    def total_load(h, total):
+        totals[h] = total
+
+    @Production(Fact(name=V('h')) &
+                Aggregate(Fact(host=V('h'), load=V('l')), max='l',
+                          to=V('peak')))
+    def peak_load():
+        pass
+
+    net.add_production(total_load)
+    net.add_production(peak_load)
+    assert isinstance(total_load.p_nodes[0].parent, AggregateNode)
+
+    facts = [Fact(host='a', load=2), Fact(host='a', load=3),
+             Fact(host='b', load=7), Fact(name='a')]
+    for f in facts:
+        net.add_fact(f)
+    net.run(None)
+    assert totals == {'a': 5, 'b': 7}
+    assert [t.binding[V('peak')] for t in peak_load.activations] == [3]
+
+    facts[1]['load'] = 1
+    net.update_fact(facts[1])
+    net.run(None)
+    assert totals == {'a': 3, 'b': 7}
+    assert [t.binding[V('peak')] for t in peak_load.activations] == [2]
+
+    net.remove_fact(facts[2])
+    assert len(list(total_load.activations)) == 1
+    net.remove_fact(facts[0])
+    net.remove_fact(facts[1])
+    assert len(list(total_load.activations)) == 0
+    assert len(list(peak_load.activations)) == 0
+
+
+def test_aggregate_functions():
+    net = ReteNetwork()
+    results = {}
+
+    def record(function, value):
+        @Production(Aggregate(Cond(V('x'), 'load', V('l')), to=V('r'),
+                              **{function: value}))
+        def p(r):
+            results[function] = r
+        return p
+
+    for function, value in [('count', True), ('min', 'l'), ('collect', 'l')]:
+        net.add_production(record(function, value))
+
+    for i, load in enumerate([4, 1, 1, 3]):
+        net.add_wme(WME(i, 'load', load))
+    net.run(None)
+    assert results == {'count': 4, 'min': 1, 'collect': (4, 1, 1, 3)}
+
+    net.remove_wme(WME(1, 'load', 1))
+    net.remove_wme(WME(2, 'load', 1))
+    net.run(None)
+    assert results == {'count': 2, 'min': 3, 'collect': (4, 3)}
+
+    with pytest.raises(ValueError):
+        Aggregate(Cond(V('x'), 'load', V('l')), sum='l', max='l', to=V('r'))
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_deep_chain(merge_memories):
+    # Deeper than the recursion limit allows if nodes call each other.
+    depth = 1200
+    conds = [Cond(V('x{}'.format(i)), 'next{}'.format(i),
+                  V('x{}'.format(i + 1))) for i in range(depth)]
+    conds.insert(depth // 2, Neg(V('x0'), 'blocked', True))
+
+    @Production(AND(*conds))
+    def chain():
+        pass
+
+    net = ReteNetwork(merge_memories=merge_memories)
+    net.add_production(chain)
+    wmes = [WME('n{}'.format(i), 'next{}'.format(i), 'n{}'.format(i + 1))
+            for i in range(depth)]
+    for wme in wmes:
+        net.add_wme(wme)
+    assert len(list(net.matches)) == 1
+
+    net.add_wme(WME('n0', 'blocked', True))
+    assert len(list(net.matches)) == 0
+    net.remove_wme(WME('n0', 'blocked', True))
+    assert len(list(net.matches)) == 1
+
+    net.remove_wme(wmes[0])
+    assert len(list(net.matches)) == 0
+    net.add_wme(wmes[0])
+    assert len(list(net.matches)) == 1
+
+    net.remove_production(chain)
+    assert net.num_nodes() == 1
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_deferred_steps(merge_memories):
+    def build(deferred):
+        @Production(Fact(a=V('x'), b=V('y')) & Fact(a=V('y'), b=V('z')) &
+                    ~Fact(c=V('z')))
+        def p0():
+            pass
+
+        net = ReteNetwork(merge_memories=merge_memories, deferred=deferred)
+        net.add_production(p0)
+        return net, p0
+
+    def result(p):
+        return sorted((t.binding[V('x')], t.binding[V('y')],
+                       t.binding[V('z')]) for t in p.activations)
+
+    nets = [build(False), build(True)]
+    for net, p in nets:
+        facts = [Fact(a=i % 3, b=(i + 1) % 3) for i in range(12)]
+        facts.append(Fact(c=1))
+        net.add_facts(facts[:6])
+        for f in facts[6:]:
+            net.add_fact(f)
+        net.remove_fact(facts[0])
+        facts[1]['b'] = 0
+        net.update_fact(facts[1])
+
+    deferred, p = nets[1]
+    assert deferred.pending_work() > 0
+    assert not list(p.activations)
+    steps = 0
+    while deferred.step(5):
+        steps += 1
+        assert deferred.pending_work() > 0
+    assert steps > 1
+    assert result(p) == result(nets[0][1])
+    assert deferred.step() == 0
+
+    deferred.add_fact(Fact(c=2))
+    deferred.step(seconds=60)
+    assert deferred.pending_work() == 0
+    assert len(list(p.activations)) < len(list(nets[0][1].activations))
+
+    deferred.add_fact(Fact(a=2, b=2))
+    deferred.run(None)
+    assert deferred.pending_work() == 0
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_deferred_skips_deleted_tokens(merge_memories):
+    # The negative node deletes the token that a pending join activation
+    # extends, so the activation is skipped.
+    def build(deferred):
+        @Production(AND(Cond(V('a'), 'p', V('b')),
+                        NOT(Cond(V('b'), 'q', V('c'))),
+                        Cond(V('a'), 'q', V('d'))))
+        def p0():
+            pass
+
+        net = ReteNetwork(merge_memories=merge_memories, deferred=deferred)
+        net.add_production(p0)
+        return net, p0
+
+    nets = [build(False), build(True), build(True)]
+    assert nets[1][0].activator is not nets[2][0].activator
+    for wme in [WME('x', 'p', 'x'), WME('x', 'q', 'y'), WME('z', 'p', 'w'),
+                WME('z', 'q', 'v')]:
+        # The deferred networks are stepped in turns, one activation at a
+        # time.
+        for net, _ in nets:
+            net.add_wme(wme)
+        while nets[1][0].pending_work() or nets[2][0].pending_work():
+            nets[1][0].step(1)
+            nets[2][0].step(1)
+
+    results = [sorted(sorted(t.binding.items(), key=str)
+                      for t in p.activations) for _, p in nets]
+    assert results[0] == [[(V('a'), 'z'), (V('b'), 'w'), (V('d'), 'v')]]
+    assert results[1] == results[0]
+    assert results[2] == results[0]
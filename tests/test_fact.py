@@ -1,5 +1,10 @@
 from py_rete.fact import Fact
 from py_rete.network import ReteNetwork
+from py_rete.production import Production
+from py_rete.common import WME
+from py_rete.common import V
+from py_rete.conditions import Cond
+import pytest
 
 
 class SubFact(Fact):
@@ -30,3 +35,151 @@ def test_adding_removing_facts():
     assert f.id is None
 
     assert len(net.working_memory) == 0
+
+
+def test_update_fact_only_changed_attributes():
+    net = ReteNetwork()
+
+    @Production(Fact(name=V('name')))
+    def has_name(name):
+        pass
+
+    @Production(Fact(count=V('count')))
+    def has_count(count):
+        pass
+
+    net.add_production(has_name)
+    net.add_production(has_count)
+
+    f = Fact(name='counter', count=0)
+    net.add_fact(f)
+    fact_id = f.id
+    name_token = list(has_name.activations)[0]
+
+    f['count'] = 1
+    net.update_fact(f)
+
+    assert f.id == fact_id
+    assert list(has_name.activations) == [name_token]
+    assert [t.binding[V('count')] for t in has_count.activations] == [1]
+    assert WME(fact_id, 'count', 0) not in net.working_memory
+    assert len(net.working_memory) == 3
+
+    del f['count']
+    net.update_fact(f)
+    assert list(has_name.activations) == [name_token]
+    assert len(list(has_count.activations)) == 0
+    assert len(net.working_memory) == 2
+
+
+def test_whole_fact_matching():
+    matches = []
+    for whole_facts in [False, True]:
+        net = ReteNetwork(whole_facts=whole_facts)
+
+        @Production(V('p') << Fact(kind='person', name=V('n'), age=V('a')) &
+                    Fact(kind='pet', owner=V('n')))
+        def has_pet(p, n):
+            pass
+
+        @Production(Fact(kind='person', name=V('n')) &
+                    ~Fact(kind='pet', owner=V('n')))
+        def no_pet(n):
+            pass
+
+        net.add_production(has_pet)
+        net.add_production(no_pet)
+
+        alice = Fact(kind='person', name='alice', age=30)
+        bob = Fact(kind='person', name='bob', age=40)
+        rex = Fact(kind='pet', owner='alice')
+        for f in [alice, bob, rex]:
+            net.add_fact(f)
+
+        rex['owner'] = 'bob'
+        net.update_fact(rex)
+
+        matches.append((sorted(t.binding[V('n')]
+                               for t in has_pet.activations),
+                        sorted(t.binding[V('n')]
+                               for t in no_pet.activations)))
+
+        if whole_facts:
+            assert len(net.working_memory) == 3
+            assert list(has_pet.activations)[0].binding[V('p')] == bob.id
+
+        net.remove_fact(rex)
+        assert len(list(has_pet.activations)) == 0
+        assert len(list(no_pet.activations)) == 2
+
+        net.remove_production(has_pet)
+        net.remove_production(no_pet)
+        assert len(net.alpha_hash) == 0
+
+    assert matches[0] == matches[1] == (['bob'], ['alice'])
+
+
+def test_whole_facts_and_plain_wmes():
+    # Productions added late only get the wmes of their own kind, as when the
+    # wmes are added.
+    net = ReteNetwork(whole_facts=True)
+    net.add_wme(WME('b1', 'color', 'red'))
+    net.add_fact(Fact(color='blue'))
+
+    @Production(Fact(color=V('c')))
+    def colored(c):
+        pass
+
+    @Production(Cond(V('x'), V('a'), V('v')))
+    def any_wme(x, a, v):
+        pass
+
+    net.add_production(colored)
+    net.add_production(any_wme)
+    assert [t.binding[V('c')] for t in colored.activations] == ['blue']
+    assert [t.binding[V('x')] for t in any_wme.activations] == ['b1']
+
+    net.add_fact(Fact(color='green'))
+    net.add_wme(WME('b2', 'color', 'red'))
+    assert len(list(colored.activations)) == 2
+    assert len(list(any_wme.activations)) == 2
+
+
+def test_add_remove_facts():
+    net = ReteNetwork()
+
+    @Production(Fact(name=V('n'), parent=V('p')) & Fact(name=V('p')))
+    def has_parent(n, p):
+        pass
+
+    net.add_production(has_parent)
+
+    facts = [Fact(name='a', parent='b'), Fact(name='b', parent='c'),
+             Fact(name='c')]
+    net.add_facts(facts)
+    assert all(f.id is not None for f in facts)
+    assert len(list(has_parent.activations)) == 2
+
+    with pytest.raises(ValueError):
+        net.remove_facts([facts[0], Fact(name='d')])
+    assert facts[0].id is not None
+
+    with pytest.raises(ValueError):
+        net.remove_facts([facts[1], facts[2], facts[1]])
+    assert facts[1].id is not None and facts[2].id is not None
+
+    net.remove_facts(facts[1:])
+    assert len(list(has_parent.activations)) == 0
+    assert len(net.working_memory) == 3
+
+    # A failed batch does not add (or give ids to) any of its facts.
+    added = Fact(name='e')
+    net.add_fact(added)
+    new = Fact(name='f', parent='e')
+    for batch in [[new, added], [new, new]]:
+        with pytest.raises(ValueError):
+            net.add_facts(batch)
+        assert new.id is None
+        assert len(net.facts) == 2
+    net.add_facts([new])
+    assert len(list(has_parent.activations)) == 1
@@ -6,6 +6,8 @@ from py_rete.conditions import Bind
 from py_rete.network import ReteNetwork
 from py_rete.common import WME
 from py_rete.common import V
+from py_rete.fact import Fact
+import inspect
 
 
 def test_filter_compare():
@@ -80,3 +82,29 @@ def test_bind():
     t1 = list(p1.activations)[0]
     assert t0.binding[V('num')] == 50
     assert t1.binding[V('num')] == 10
+
+
+def test_function_args_resolved_once(monkeypatch):
+    net = ReteNetwork()
+    seen = []
+
+    @Production(V('f') << Fact(name=V('n'), value=V('x')) &
+                Filter(lambda net, x: net is not None and x > 1) &
+                Bind(lambda n, x: n * x, V('y')))
+    def p0(net, f, y):
+        seen.append((net, f, y))
+
+    net.add_production(p0)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("signature inspected per activation")
+    monkeypatch.setattr(inspect, 'getfullargspec', fail)
+    monkeypatch.setattr(inspect, 'signature', fail)
+
+    f = Fact(name='a', value=2)
+    net.add_fact(f)
+    net.add_fact(Fact(name='b', value=1))
+
+    assert len(list(p0.activations)) == 1
+    list(net.matches)[0].fire()
+    assert seen == [(net, f, 'aa')]
@@ -0,0 +1,131 @@
+from py_rete.common import WME
+from py_rete.common import V
+from py_rete.conditions import AND
+from py_rete.conditions import Cond
+from py_rete.conditions import Neg
+from py_rete.conditions import Ncc
+from py_rete.conditions import Filter
+from py_rete.conditions import Bind
+from py_rete.fact import Fact
+from py_rete.network import ReteNetwork
+from py_rete.production import Production
+from py_rete.memory_join_node import MemoryJoinNode
+import pytest
+
+
+def get_matches(net):
+    return sorted((m.pnode.production.__wrapped__.__name__,
+                   sorted((v.name, repr(val)) for v, val in
+                          m.token.binding.items()
+                          if not v.name.startswith('genvar')))
+                  for m in net.matches)
+
+
+def make_productions():
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Cond(V('y'), 'left-of', V('z')),
+                    Cond(V('z'), 'color', 'red')))
+    def chain():
+        pass
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Cond(V('y'), 'left-of', V('z')),
+                    Neg(V('z'), 'color', 'red')))
+    def chain_not_red():
+        pass
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Ncc(Cond(V('y'), 'left-of', V('z')),
+                        Cond(V('z'), 'color', 'red'))))
+    def on_without_red_neighbor():
+        pass
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Filter(lambda x, y: x < y),
+                    Bind(lambda x: x + x, V('xx')),
+                    Cond(V('y'), 'color', V('c'))))
+    def ordered_color():
+        pass
+
+    @Production(Fact(kind='block', name=V('n')) &
+                ~Fact(kind='block', above=V('n')))
+    def clear():
+        pass
+
+    return [chain, chain_not_red, on_without_red_neighbor, ordered_color,
+            clear]
+
+
+def run_scenario(merge_memories):
+    net = ReteNetwork(merge_memories=merge_memories)
+    prods = make_productions()
+    history = []
+
+    wmes = [WME('B1', 'on', 'B2'), WME('B1', 'on', 'B3'),
+            WME('B2', 'left-of', 'B3'), WME('B3', 'left-of', 'B4'),
+            WME('B3', 'color', 'red'), WME('B2', 'color', 'blue'),
+            WME('B4', 'color', 'red')]
+
+    net.add_production(prods[0])
+    net.add_production(prods[1])
+    for wme in wmes[:4]:
+        net.add_wme(wme)
+        history.append(get_matches(net))
+
+    for p in prods[2:]:
+        net.add_production(p)
+        history.append(get_matches(net))
+
+    for wme in wmes[4:]:
+        net.add_wme(wme)
+        history.append(get_matches(net))
+
+    a = Fact(kind='block', name='a')
+    b = Fact(kind='block', name='b', above='a')
+    net.add_fact(a)
+    net.add_fact(b)
+    history.append(get_matches(net))
+
+    for wme in [wmes[4], wmes[2], wmes[0]]:
+        net.remove_wme(wme)
+        history.append(get_matches(net))
+
+    net.remove_fact(b)
+    net.add_wme(wmes[2])
+    history.append(get_matches(net))
+
+    for p in prods:
+        net.remove_production(p)
+        history.append(get_matches(net))
+
+    assert len(net.alpha_hash) == 0
+    return history
+
+
+def test_merged_memories_match_standard_layout():
+    assert run_scenario(True) == run_scenario(False)
+
+
+@pytest.mark.parametrize('merge_memories', [False, True])
+def test_merged_memory_node_count(merge_memories):
+    net = ReteNetwork(merge_memories=merge_memories)
+
+    @Production(AND(Cond(V('x'), 'on', V('y')),
+                    Cond(V('y'), 'left-of', V('z')),
+                    Cond(V('z'), 'color', 'red')))
+    def p0():
+        pass
+
+    net.add_production(p0)
+    for wme in [WME('B1', 'on', 'B2'), WME('B2', 'left-of', 'B3'),
+                WME('B3', 'color', 'red')]:
+        net.add_wme(wme)
+    assert len(list(p0.activations)) == 1
+
+    # root, beta memories and join nodes, pnode
+    if merge_memories:
+        assert net.num_nodes() == 1 + 1 + 3 + 1
+        assert isinstance(p0.p_nodes[0].parent, MemoryJoinNode)
+    else:
+        assert net.num_nodes() == 1 + 3 + 3 + 1
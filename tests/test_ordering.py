@@ -0,0 +1,122 @@
+from py_rete.common import WME
+from py_rete.common import V
+from py_rete.conditions import AND
+from py_rete.conditions import Cond
+from py_rete.conditions import Neg
+from py_rete.conditions import Ncc
+from py_rete.conditions import Filter
+from py_rete.conditions import Bind
+from py_rete.network import ReteNetwork
+from py_rete.production import Production
+from py_rete.ordering import order_conditions
+from py_rete.join_node import JoinNode
+
+
+def test_order_conditions():
+    sizes = {'big': 100, 'small': 1, 'mid': 10}
+
+    def cost(cond, bound):
+        return sizes.get(cond.attribute, 50)
+
+    big = Cond(V('x'), 'big', V('y'))
+    small = Cond(V('z'), 'small', V('w'))
+    mid = Cond(V('y'), 'mid', V('z'))
+    test = Filter(lambda x, y: x != y)
+    neg = Neg(V('y'), 'blocked', True)
+    assert order_conditions([big, mid, small, test, neg], cost) == [
+        small, mid, big, test, neg]
+
+    # A negation keeps its place relative to the conditions that bind (or
+    # would bind) its variables, a filter or bind is placed once its
+    # variables are bound.
+    later = Cond(V('x'), 'small', V('y'))
+    assert order_conditions([big, Neg(V('y'), 'mid', True), later], cost) == [
+        big, Neg(V('y'), 'mid', True), later]
+    assert order_conditions([Neg(V('y'), 'mid', True), big, later],
+                            cost) == [Neg(V('y'), 'mid', True), later, big]
+    bind = Bind(lambda w: w + 1, V('v'))
+    use = Cond(V('v'), 'big', V('u'))
+    assert order_conditions([use, small, bind], cost) == [small, bind, use]
+    assert order_conditions([small, bind, use], cost) == [small, bind, use]
+    retest = Cond(V('w'), 'mid', V('z'))
+    positive = Filter(lambda w: w > 0)
+    assert order_conditions([retest, small, positive], cost) == [
+        small, positive, retest]
+
+    # The conditions of an ncc are reordered as well.
+    ncc = Ncc(Cond(V('a'), 'big', V('b')), Cond(V('y'), 'small', V('a')))
+    assert order_conditions([big, ncc], cost) == [
+        big, Ncc(Cond(V('y'), 'small', V('a')), Cond(V('a'), 'big', V('b')))]
+
+
+def join_attributes(prod):
+    node = prod.p_nodes[0]
+    attributes = []
+    while node is not None:
+        if type(node) is JoinNode:
+            attributes.insert(0, node.condition.attribute)
+        node = node.parent
+    return attributes
+
+
+def test_reorder_with_alpha_memory_sizes():
+    def build(reorder):
+        net = ReteNetwork(reorder=reorder)
+        for i in range(50):
+            net.add_wme(WME('b{}'.format(i), 'big', i % 5))
+        for i in range(2):
+            net.add_wme(WME('s{}'.format(i), 'small', i))
+
+        @Production(AND(Cond(V('x'), 'big', V('v')),
+                        Cond(V('y'), 'small', V('v'))))
+        def p():
+            pass
+
+        net.add_production(p)
+        return net, p
+
+    net, p = build(False)
+    assert join_attributes(p) == ['big', 'small']
+    reordered, q = build(True)
+    assert join_attributes(q) == ['small', 'big']
+    assert (sorted((t.binding[V('x')], t.binding[V('y')])
+                   for t in p.activations) ==
+            sorted((t.binding[V('x')], t.binding[V('y')])
+                   for t in q.activations))
+
+
+def test_replan():
+    net = ReteNetwork(replan=2)
+    net.replan_interval = 10
+
+    @Production(AND(Cond(V('x'), 'big', V('v')),
+                    Cond(V('y'), 'small', V('v'))))
+    def p():
+        pass
+
+    for i in range(3):
+        net.add_wme(WME('b{}'.format(i), 'big', i))
+    for i in range(6):
+        net.add_wme(WME('s{}'.format(i), 'small', i % 3))
+    net.add_production(p)
+    assert join_attributes(p) == ['big', 'small']
+    net.run(None)
+    assert len(list(p.activations)) == 6
+    fired = [list(node.fired) for node in p.p_nodes]
+
+    # The big memory grows, the production is rebuilt with small first and
+    # the matches that were fired are not fired again.
+    for i in range(3, 30):
+        net.add_wme(WME('b{}'.format(i), 'big', 10 + i))
+    assert join_attributes(p) == ['small', 'big']
+    assert [list(node.fired) for node in p.p_nodes] != fired
+    assert len(list(p.activations)) == 6
+    assert len(list(net.new_matches)) == 0
+    assert net.agenda.select() is None
+
+    net.add_wme(WME('b30', 'big', 0))
+    assert len(list(net.new_matches)) == 2
+
+    net.remove_production(p)
+    assert not net.plans
+    assert net.num_nodes() == 1